@@ -0,0 +1,25 @@
+"""
+Script to list the months missing from the per-region files of every source, without Earth Engine or the manifest, and save them as one work list.
+
+Re-run the matching `Check_for_missing_data` script to fill them - only the listed units are requested.
+
+Edit as necessary.
+"""
+import os
+import sys
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extraction_sources import SOURCES
+from gap_scanner import scan_gaps, print_worklist
+from ecoregion_registry import region_codes
+
+output_dir = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs' # <-- Edit as necessary
+worklist_path = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/missing_units.csv' # <-- Edit as necessary
+
+worklist = pd.concat([scan_gaps(source_name, output_dir, region_codes()) for source_name in SOURCES], ignore_index=True)
+if worklist.empty:
+    print("All files are complete.")
+else:
+    print_worklist(worklist)
+worklist.to_csv(worklist_path, index=False)
+print(f"Saved {worklist_path}")
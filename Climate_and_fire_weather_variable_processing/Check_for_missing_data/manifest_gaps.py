@@ -0,0 +1,26 @@
+"""
+Script to list the months still missing for each source from the checkpoint manifest, without touching Earth Engine.
+
+Re-run the matching `Process_data` or `Check_for_missing_data` script to fill them - the completed months are skipped.
+
+Edit as necessary.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extraction_sources import SOURCES
+from checkpoint_manifest import open_manifest, missing_units
+
+manifest = open_manifest()
+
+for source_name in SOURCES:
+    missing = missing_units(manifest, source_name)
+    if missing.empty:
+        print(f"{source_name}: complete")
+        continue
+    counts = missing.groupby(['region', 'model', 'scenario']).size()
+    print(f"{source_name}: {len(missing)} missing months in {len(counts)} region runs")
+    for (region, model, scenario), count in counts.items():
+        print(f"    {region} {model} {scenario}: {count}")
+
+manifest.close()
@@ -1,109 +1,49 @@
 """
 Script to check whether any processing steps have been missed and, if so, fill in any gaps for the historical NASA-downscaled CMIP6 climate data. This can occur when batch running multiple scripts simultaneously.
 
+Earth Engine is only started if the file scan (`gap_scanner.py`) finds missing months, and only those are requested through the shared request pool (see `ee_requests.py`).
+
 Edit as necessary.
 """
 import os
-import pandas as pd
-from calendar import monthrange
-import ee
-
-# Authenticate and initialize EE
-ee.Authenticate()
-ee.Initialize(project='spherical-berm-323321') # <-- Edit as necessary
-
-# Load the ecoregions and apply filters
-ecoRegions = ee.FeatureCollection('RESOLVE/ECOREGIONS/2017')
-biome_filter = ee.Filter.inList('BIOME_NUM', [6, 11])
-realm_filter = ee.Filter.inList('REALM', ['Nearctic', 'Palearctic'])
-selected_regions = ecoRegions.filter(ee.Filter.And(biome_filter, realm_filter))
-region_list = selected_regions.toList(selected_regions.size())
-
-# Climate bands
-bands = ['hurs', 'pr', 'rlds', 'rsds', 'sfcWind', 'tas', 'tasmax', 'tasmin']
-expected_months = pd.date_range('2001-01-01', '2014-12-01', freq='MS').strftime('%Y-%m')
-
-# Loop through each region creating a short name
-for i in range(region_list.size().getInfo()):
-    feature = ee.Feature(region_list.get(i))
-    if i == 5:
-        eco_name = 'Eastern Canadian Shield taiga'
-        short_name = 'eashti'
-    elif i == 19:
-        eco_name = 'Northeast Siberian taiga'
-        short_name = 'nesibta'
-    elif i == 45:
-        eco_name = 'Kalaallit Nunaat Arctic steppe'
-        short_name = 'kalste'
-    else:
-        eco_name = feature.get('ECO_NAME').getInfo()
-        words = eco_name.split()
-        short_name = (words[0][:4] + words[1][:3]).lower() if len(words) >= 2 else words[0][:7].lower()
-
-    for model in ['access', 'mri']:
-        output_path = f'/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs/{model}_climate_2001_2014_{short_name}.csv' # <-- Edit as necessary
-
-        # Load existing CSV and detect missing months
-        if os.path.exists(output_path):
-            df_existing = pd.read_csv(output_path, parse_dates=['date'])
-            df_existing['year_month'] = df_existing['date'].dt.strftime('%Y-%m')
-            existing_months = set(df_existing['year_month'])
-        else:
-            df_existing = pd.DataFrame()
-            existing_months = set()
-
-        missing_months = sorted(set(expected_months) - existing_months)
-        if not missing_months:
-            print(f"{model.upper()} {short_name} already complete.")
-            continue
-
-        print(f"Backfilling {model.upper()} {short_name}: missing months - {', '.join(missing_months)}")
-
-        new_data = []
-        for ym in missing_months:
-            year, month = map(int, ym.split('-'))
-            print(f"Processing {year}-{month} for {model}")
-
-            _, last_day = monthrange(year, month)
-            file_path = f"gs://clelland_fire_ml/training_nasa_{model}_firecci/nasa_{model}_firecci_{year}_{month}.tif" # <-- Check permission
-
-            try:
-                image = ee.Image.loadGeoTIFF(file_path).clip(feature.geometry()).updateMask(
-                    ee.Image.loadGeoTIFF(file_path).clip(feature.geometry()).neq(-9999)
-                )
-
-                means = {band: image.select(band).reduceRegion(
-                    reducer=ee.Reducer.mean(),
-                    geometry=feature.geometry(),
-                    scale=4000,
-                    maxPixels=1e8
-                ).get(band).getInfo() for band in bands}
-
-                means['year'] = year
-                means['month'] = month
-
-                if means['pr'] is not None:
-                    means['pr'] *= last_day * 24 * 60 * 60 * 0.001  # Convert to mm/month
-
-                new_data.append(means)
-
-            except Exception as e:
-                print(f"Skipped {ym} for {model} {short_name}: {e}")
-                continue
-
-        if new_data:
-            df_new = pd.DataFrame(new_data)
-            df_new['date'] = pd.to_datetime(df_new[['year', 'month']].assign(day=1))
-            df_new.drop(columns=['year', 'month'], inplace=True)
-            df_new.rename(columns={"hurs": "rh"}, inplace=True)
-
-            if not df_existing.empty:
-                df_combined = pd.concat([df_existing.drop(columns=['year_month']), df_new], ignore_index=True)
-            else:
-                df_combined = df_new
-
-            df_combined.sort_values('date', inplace=True)
-            df_combined.to_csv(output_path, index=False)
-            print(f"Saved updated CSV for {model.upper()} {short_name}")
-        else:
-            print(f"No new data retrieved for {model.upper()} {short_name}")
\ No newline at end of file
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ee_requests import RequestPool
+from extraction_backends import get_backend
+from checkpoint_manifest import open_manifest
+from extraction_runs import fill_gaps
+from gap_scanner import scan_gaps, print_worklist
+from ecoregion_registry import region_codes
+
+# Bands, masking, unit conversions and expected months are defined in extraction_sources.py
+source_name = 'cmip_hist_climate'
+
+output_dir = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs' # <-- Edit as necessary
+
+# Output format: 'csv', or 'parquet' (columnar, typed date index)
+output_format = 'csv' # <-- Edit as necessary
+
+# Find the missing months from the files alone
+worklist = scan_gaps(source_name, output_dir, region_codes())
+if worklist.empty:
+    print(f"All {source_name} files are complete.")
+    sys.exit()
+print_worklist(worklist)
+
+# Earth Engine, or the local mock backend with EXTRACTION_BACKEND=mock (extraction_backends.py)
+backend = get_backend(project='spherical-berm-323321') # <-- Edit as necessary
+
+# Concurrency cap and rate limit for the Earth Engine requests
+max_workers = 20 # <-- Edit as necessary
+requests_per_second = 10 # <-- Edit as necessary
+pool = RequestPool(max_workers, requests_per_second)
+manifest = open_manifest()
+
+# Short names, RESOLVE names (from the cached registry in ecoregion_registry.py) and geometries of the ecoregions
+registry, geometries = backend.regions(pool)
+
+# Request the missing units concurrently and write the affected files again from the manifest
+fill_gaps(backend, pool, manifest, source_name, registry, geometries, worklist, output_dir, output_format)
+
+pool.shutdown()
+manifest.close()
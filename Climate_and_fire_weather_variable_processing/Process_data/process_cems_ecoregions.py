@@ -1,97 +1,50 @@
 """
 Script to process CEMS data, stored in Google Cloud Storage buckets from the model training, to csv files for each ecoregion using Google Earth Engine.
 
-Edit as necessary.
-"""
-import pandas as pd
-from calendar import monthrange
-import ee
-ee.Authenticate()
-ee.Initialize(project='spherical-berm-323321') # <-- Edit as necessary
-
-# Load the ecoregions
-ecoRegions = ee.FeatureCollection('RESOLVE/ECOREGIONS/2017')
-
-# Apply filters
-biome_filter = ee.Filter.inList('BIOME_NUM', [6, 11])
-realm_filter = ee.Filter.inList('REALM', ['Nearctic', 'Palearctic'])
-combined_filter = ee.Filter.And(biome_filter, realm_filter)
-selected_regions = ecoRegions.filter(combined_filter)
-region_list = selected_regions.toList(selected_regions.size())
+Requests go through the shared request pool (see `ee_requests.py`) and are checkpointed in the manifest (`checkpoint_manifest.py`), so a restarted run skips the months already done.
 
-# Bands to extract
-bands = ['build_up_index', 'drought_code', 'duff_moisture_code', 'fine_fuel_moisture_code', 'fire_weather_index', 'initial_fire_spread_index']
+To add new months (e.g. December 2023 and 2024) set update_range: only those months are requested, and they are appended as new rows to csv files and as a new file in the partitioned store (`ecoregion_store.py`), without rewriting the months already there. Parquet files can't be appended to, so with output_format = 'parquet' the per-region file is written again with the new months after its existing rows. Run it again with a later range for each monthly update.
 
-# Loop through each region creating a short name
-for i in range(region_list.size().getInfo()):
-    feature = ee.Feature(region_list.get(i))
-    if i == 5:
-        eco_name = 'Eastern Canadian Shield taiga'
-        short_name = 'eashti'
-    elif i == 19:
-        eco_name = 'Northeast Siberian taiga'
-        short_name = 'nesibta'
-    elif i == 45:
-        eco_name = 'Kalaallit Nunaat Arctic steppe'
-        short_name = 'kalste'
-    else:
-        eco_name = feature.get('ECO_NAME').getInfo()
-        words = eco_name.split()
-        short_name = (words[0][:4] + words[1][:3]).lower() if len(words) >= 2 else words[0][:7].lower()
-
-    print(f"Processing region: {eco_name} -> {short_name}")
+Edit as necessary.
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ee_requests import RequestPool
+from extraction_backends import get_backend
+from checkpoint_manifest import open_manifest
+from extraction_runs import process_regions
 
-    # List to store results for this region
-    region_data = []
+# Bands, masking, unit conversions, model/scenario runs and file names are defined in extraction_sources.py
+source_name = 'cems'
 
-    for year in range(2001, 2024):  # From 2001 to 2023
-        for month in range(1, 13):
-            print(f"Iterating over {year}-{month}")
-            if year == 2023 and month == 12:
-                continue
+output_dir = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs' # <-- Edit as necessary
 
-            _, last_day = monthrange(year, month)
-            file_path = f"gs://clelland_fire_ml/training_e5l_cems_mcd/cems_e5l_mcd_{year}_{month}.tif" # <-- Check permission
+# Output format: 'csv', or 'parquet' (columnar, typed date index)
+output_format = 'csv' # <-- Edit as necessary
 
-            # Load the image
-            image = ee.Image.loadGeoTIFF(file_path)
+# Months to append to the existing files, e.g. ('2023-12', '2024-12'), or None to process the full record
+update_range = None # <-- Edit as necessary
+start, end = update_range or (None, None)
 
-            # Clip and mask
-            clipped_image = image.clip(feature.geometry())
-            clipped_image = clipped_image.updateMask(clipped_image.neq(-9999))
+# Also append the new months to the partitioned store
+append_store = True # <-- Edit as necessary
 
-            # Extract band means
-            try:
-                means = {band: clipped_image.select(band).reduceRegion(
-                    reducer=ee.Reducer.mean(),
-                    geometry=feature.geometry(),
-                    scale=4000,
-                    maxPixels=1e8
-                ).get(band).getInfo() for band in bands}
-            except Exception as e:
-                print(f"Skipped {year}-{month} for {short_name}: {e}")
-                continue
+# Earth Engine, or the local mock backend with EXTRACTION_BACKEND=mock (extraction_backends.py)
+backend = get_backend(project='spherical-berm-323321') # <-- Edit as necessary
 
-            means['year'] = year
-            means['month'] = month
+# Concurrency cap and rate limit for the Earth Engine requests
+max_workers = 20 # <-- Edit as necessary
+requests_per_second = 10 # <-- Edit as necessary
+pool = RequestPool(max_workers, requests_per_second)
+manifest = open_manifest()
 
-            region_data.append(means)
+# Short names, RESOLVE names (from the cached registry in ecoregion_registry.py) and geometries of the ecoregions
+registry, geometries = backend.regions(pool)
 
-    # Create DataFrame for the region
-    df = pd.DataFrame(region_data)
-    if not df.empty:
-        df['date'] = pd.to_datetime(df[['year', 'month']].assign(day=1))
-        df.set_index('date', inplace=True)
-        df.drop(columns=['year', 'month'], inplace=True)
-        df.rename(columns={"build_up_index": "BUI", 
-                        "drought_code": "DC", 
-                        "duff_moisture_code": "DMC", 
-                        "fine_fuel_moisture_code": "FFMC", 
-                        "fire_weather_index": "FWI", 
-                        "initial_fire_spread_index": "ISI"}, inplace=True)
+# Extract the months not already in the manifest concurrently, then write each region's files
+process_regions(backend, pool, manifest, source_name, registry, geometries, output_dir, output_format, start, end,
+                append=update_range is not None, append_store=append_store)
 
-        # Save to CSV
-        output_path = f'/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs/cems_2001_2023_{short_name}.csv' # <-- Edit as necessary
-        df.to_csv(output_path)
-    else:
-        print(f"No data extracted for region: {short_name}")
\ No newline at end of file
+pool.shutdown()
+manifest.close()
@@ -0,0 +1,59 @@
+"""
+Script to process any source to files for each ecoregion from a local mirror of the Google Cloud Storage bucket, without Earth Engine.
+
+Each monthly GeoTIFF is read once, one block at a time, and the band means of every ecoregion are found against a cached label raster (`local_zonal_stats.py`), spread over a process pool. The means go into the checkpoint manifest like the Earth Engine scripts, so a restarted run skips the months already done, and the output files have the same columns and names.
+
+Edit as necessary.
+"""
+import os
+import sys
+import geopandas as gpd
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from checkpoint_manifest import open_manifest, register_region, completed_units, record_unit, run_units, region_table
+from extraction_sources import SOURCES, output_name, write_table
+from local_zonal_stats import zonal_means
+from ecoregion_registry import SHP_PATH, region_gdfs
+
+# Bands, masking and unit conversions are defined in extraction_sources.py
+source_name = 'cmip_future_fwi' # <-- Edit as necessary
+
+# Local copy of the bucket, e.g. mirror_root/clelland_fire_ml/CMIP6_files/...
+mirror_root = '/gws/nopw/j04/bas_climate/users/clelland/gcs_mirror' # <-- Edit as necessary
+
+# Label raster on the grid of the source, rasterised once and cached
+label_cache_path = f'/home/users/clelland/Model/Analysis/RESOLVE shapefile from GEE/resolve_labels_{source_name}.npz' # <-- Edit as necessary
+
+# Processes reading files concurrently
+n_workers = int(os.environ.get("SLURM_CPUS_PER_TASK", 1)) # <-- Edit as necessary
+
+output_dir = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs' # <-- Edit as necessary
+
+# Output format: 'csv', or 'parquet' (columnar, typed date index)
+output_format = 'csv' # <-- Edit as necessary
+
+manifest = open_manifest()
+
+# One GeoDataFrame per region, named by the shared region registry
+regions = region_gdfs(gpd.read_file(SHP_PATH))
+for short_name, region_gdf in regions.items():
+    register_region(manifest, short_name, region_gdf['ECO_NAME'].iloc[0])
+
+for model, scenario in SOURCES[source_name]['runs']:
+    # Skip the months already in the manifest for every region
+    done = set.intersection(*(completed_units(manifest, source_name, short_name, model, scenario) for short_name in regions))
+    units = [unit for unit in run_units(source_name, model, scenario) if (unit[2], unit[3]) not in done]
+    print(f"{source_name} {model or ''} {scenario or ''}: {len(units)} months to process")
+
+    for (_, _, year, month), region_means in zonal_means(source_name, units, regions, mirror_root, label_cache_path, n_workers):
+        for short_name, means in region_means.items():
+            record_unit(manifest, source_name, short_name, means, model, scenario)
+        print(f"Processed {year}-{month:02d}")
+
+    for short_name in regions:
+        df = region_table(manifest, source_name, short_name, model, scenario)
+        if df is not None:
+            write_table(df, os.path.join(output_dir, output_name(source_name, short_name, model, scenario)), output_format)
+        else:
+            print(f"No data extracted for region: {short_name}")
+
+manifest.close()
@@ -0,0 +1,48 @@
+"""
+Script to process any of the ERA5-Land, CEMS or NASA-downscaled CMIP6 sources to csv files for each ecoregion with server-side Google Earth Engine reductions.
+
+Each model/scenario run is built into an ee.ImageCollection of its monthly GeoTIFFs and reduceRegions is mapped over the ecoregions, so all region-month means are computed by Earth Engine and exported as one table per run rather than one request per region and month. Run with step = 'export' to start the export tasks, then with step = 'split' once they have finished to write the per-region files with the same columns as the other processing scripts.
+
+Edit as necessary.
+"""
+import os
+import sys
+import ee
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extraction_sources import SOURCES
+from server_side_extraction import selected_regions, export_table, wait_for_tasks, split_table, table_name
+
+# One of 'e5l', 'cems', 'cmip_hist_climate', 'cmip_hist_fwi', 'cmip_future_climate' or 'cmip_future_fwi'
+source_name = 'e5l' # <-- Edit as necessary
+
+# 'export' starts the Earth Engine export tasks (and waits for them if wait is True), 'split' writes the per-region csv files from the exported tables
+step = 'export' # <-- Edit as necessary
+wait = True # <-- Edit as necessary
+
+# Where the tables are exported to and read back from (a local copy of the table folder also works)
+bucket = 'clelland_fire_ml' # <-- Check permission
+table_prefix = 'ecoregion_tables' # <-- Edit as necessary
+table_dir = f'gs://{bucket}/{table_prefix}' # <-- Edit as necessary
+
+output_dir = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs' # <-- Edit as necessary
+output_format = 'csv' # <-- 'csv', or 'parquet' (columnar, typed dates)
+
+runs = SOURCES[source_name]['runs']
+
+if step == 'export':
+    ee.Authenticate()
+    ee.Initialize(project='spherical-berm-323321') # <-- Edit as necessary
+    regions = selected_regions()
+
+    tasks = []
+    for model, scenario in runs:
+        tasks.append(export_table(source_name, regions, bucket, table_prefix, model, scenario))
+        print(f"Started export of {table_name(source_name, model, scenario)}")
+    if wait:
+        wait_for_tasks(tasks)
+
+if step == 'split' or (step == 'export' and wait):
+    for model, scenario in runs:
+        table_path = f"{table_dir}/{table_name(source_name, model, scenario)}.csv"
+        output_paths = split_table(table_path, source_name, output_dir, model, scenario, output_format)
+        print(f"Saved {len(output_paths)} ecoregion files for {source_name} {model or ''} {scenario or ''}")
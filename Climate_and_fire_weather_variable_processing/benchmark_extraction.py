@@ -0,0 +1,113 @@
+"""
+Script to benchmark the extraction of each `Process_data` and `Check_for_missing_data` script offline, against the mock backend (`extraction_backends.py`).
+
+For each source the processing script's pass (`extraction_runs.process_regions`) is run over a sample of regions and months into a temporary checkpoint manifest and output folder, then the missing-data script's pass (`gap_scanner.scan_gaps` and `extraction_runs.fill_gaps`) fills the gaps in the files it wrote, with the mock backend injected. The mock simulates latency, quota errors, dropped responses and missing files. Each pass reports the requests per second, retries, the units it added to the manifest and the gap rate (expected units still missing afterwards), to compare pool settings or spot regressions without an Earth Engine account.
+
+Edit as necessary.
+"""
+import os
+import tempfile
+import time
+import pandas as pd
+from ee_requests import RequestPool
+from extraction_backends import MockBackend
+from checkpoint_manifest import open_manifest
+from extraction_runs import process_regions, fill_gaps
+from extraction_sources import SOURCES
+from gap_scanner import scan_gaps
+
+# Script -> source it extracts
+SCRIPTS = {
+    'process_e5l_ecoregions': 'e5l',
+    'process_cems_ecoregions': 'cems',
+    'process_cmip_hist_climate_ecoregions': 'cmip_hist_climate',
+    'process_cmip_hist_fwi_ecoregions': 'cmip_hist_fwi',
+    'process_cmip_future_climate_ecoregions': 'cmip_future_climate',
+    'process_cmip_future_fwi_ecoregions': 'cmip_future_fwi',
+    'missing_e5l_ecoregions': 'e5l',
+    'missing_climate_hist_ecoregions': 'cmip_hist_climate',
+    'missing_fwi_hist_ecoregions': 'cmip_hist_fwi',
+    'missing_climate_future_ecoregions': 'cmip_future_climate',
+    'missing_fwi_future_ecoregions': 'cmip_future_fwi'
+}
+
+# Sample of the workload: first n_regions regions and first n_months months of every model/scenario run
+n_regions = 3 # <-- Edit as necessary
+n_months = 24 # <-- Edit as necessary
+
+# Simulated Earth Engine behaviour
+mock_options = {'latency': 0.2, 'jitter': 0.5, 'quota_error_rate': 0.05, 'drop_rate': 0.01, 'missing_rate': 0.01,
+                'timeout': 1, 'mirror_root': None, 'seed': 0} # <-- Edit as necessary
+
+# Request pool settings under test - the backoff is scaled down so the benchmark runs in minutes
+pool_options = {'max_workers': 20, 'requests_per_second': 10, 'max_retries': 8, 'base_delay': 0.1, 'max_delay': 5} # <-- Edit as necessary
+
+output_path = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/extraction_benchmark.csv' # <-- Edit as necessary
+
+
+def manifest_count(manifest, source_name):
+    """Number of units of a source in the manifest."""
+    return manifest.execute('SELECT COUNT(*) FROM units WHERE source = ?', (source_name,)).fetchone()[0]
+
+
+def sample_end(source_name):
+    """Last month of the first n_months months of a source's runs."""
+    return (pd.Timestamp(SOURCES[source_name]['start']) + pd.DateOffset(months=n_months - 1)).strftime('%Y-%m')
+
+
+def run_pass(script, source_name, backend, manifest, registry, geometries, output_dir):
+    """Run the pass of a processing or missing-data script over the sample, and return its statistics."""
+    pool = RequestPool(**pool_options)
+    calls_before = dict(backend.stats)
+    units_before = manifest_count(manifest, source_name)
+    end = sample_end(source_name)
+    start = time.monotonic()
+    if script.startswith('process_'):
+        process_regions(backend, pool, manifest, source_name, registry, geometries, output_dir, 'csv', end=end)
+    else:
+        worklist = scan_gaps(source_name, output_dir, list(registry), end=end)
+        if not worklist.empty:
+            fill_gaps(backend, pool, manifest, source_name, registry, geometries, worklist, output_dir, 'csv')
+    elapsed = time.monotonic() - start
+    pool.shutdown()
+
+    # Completions are the units this pass added to the manifest
+    units_after = manifest_count(manifest, source_name)
+    completed = units_after - units_before
+    expected = len(registry) * len(SOURCES[source_name]['runs']) * n_months
+    return {
+        'script': script,
+        'source': source_name,
+        'units_completed': completed,
+        'requests': pool.stats['requests'],
+        'retries': pool.stats['retries'],
+        'failures': pool.stats['failures'],
+        'quota_errors': backend.stats['quota_errors'] - calls_before['quota_errors'],
+        'dropped': backend.stats['dropped'] - calls_before['dropped'],
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(pool.stats['requests'] / elapsed, 2) if elapsed else None,
+        'units_per_second': round(completed / elapsed, 2) if elapsed else None,
+        'gap_rate': (expected - units_after) / expected if expected else 0.0
+    }
+
+
+results = []
+for source_name in SOURCES:
+    backend = MockBackend(**mock_options)
+    registry, geometries = backend.regions()
+    registry = dict(list(registry.items())[:n_regions])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = open_manifest(os.path.join(tmp, 'manifest.sqlite'))
+
+        # The processing script, then its missing-data script on the same manifest and files
+        for kind in ('process_', 'missing_'):
+            for script, script_source in SCRIPTS.items():
+                if script_source == source_name and script.startswith(kind):
+                    results.append(run_pass(script, source_name, backend, manifest, registry, geometries, tmp))
+        manifest.close()
+
+df = pd.DataFrame(results)
+print(df.to_string(index=False))
+df.to_csv(output_path, index=False)
+print(f"Saved {output_path}")
@@ -0,0 +1,117 @@
+"""
+Durable checkpoint manifest for the Earth Engine extractions.
+
+Each completed (source, model, scenario, region, year, month) unit is appended with its band means to an SQLite database as soon as it is returned, so a crash or walltime kill only loses the requests in flight. On restart the completed units are skipped and the csv files are written from the manifest, so finding missing months is a query rather than a re-scan of every csv file.
+"""
+import json
+import sqlite3
+import pandas as pd
+from extraction_sources import SOURCES, monthly_units, to_dataframe, read_table, last_run_start
+from ee_requests import fetch_region_means
+
+# One manifest shared by all sources and scripts
+MANIFEST_PATH = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/extraction_manifest.sqlite' # <-- Edit as necessary
+
+
+def open_manifest(path=MANIFEST_PATH):
+    """Open (creating if needed) the manifest. WAL mode lets several scripts append to it at once."""
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS units (source TEXT, model TEXT, scenario TEXT, region TEXT, year INTEGER, '
+                 'month INTEGER, means TEXT, PRIMARY KEY (source, model, scenario, region, year, month))')
+    conn.execute('CREATE TABLE IF NOT EXISTS regions (region TEXT PRIMARY KEY, eco_name TEXT)')
+    conn.commit()
+    return conn
+
+
+def register_region(conn, region, eco_name):
+    """Record a region short name and its ECO_NAME, so gaps can be found for regions that have no units yet."""
+    conn.execute('INSERT OR IGNORE INTO regions VALUES (?, ?)', (region, eco_name))
+    conn.commit()
+
+
+def record_unit(conn, source_name, region, means, model=None, scenario=None):
+    """Append one completed unit with its band means and commit it straight away. The first result of a unit is kept."""
+    conn.execute('INSERT OR IGNORE INTO units VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (source_name, model or '', scenario or '', region, means['year'], means['month'], json.dumps(means)))
+    conn.commit()
+
+
+def completed_units(conn, source_name, region, model=None, scenario=None):
+    """Set of (year, month) already in the manifest for one region of a source run."""
+    rows = conn.execute('SELECT year, month FROM units WHERE source = ? AND model = ? AND scenario = ? AND region = ?',
+                        (source_name, model or '', scenario or '', region))
+    return set(rows)
+
+
+def pending_units(conn, source_name, region, units):
+    """The (model, scenario, year, month) units of a region not yet in the manifest."""
+    done = {}
+    pending = []
+    for model, scenario, year, month in units:
+        if (model, scenario) not in done:
+            done[(model, scenario)] = completed_units(conn, source_name, region, model, scenario)
+        if (year, month) not in done[(model, scenario)]:
+            pending.append((model, scenario, year, month))
+    return pending
+
+
+def run_units(source_name, model=None, scenario=None, start=None, end=None):
+    """Every (model, scenario, year, month) unit of a source run, or only those from start to end if given."""
+    return [(model, scenario, year, month) for year, month in monthly_units(source_name, start, end)]
+
+
+def extract_units(pool, conn, source_name, geometry, region, units, backend=None):
+    """Request the units of a region that are not yet in the manifest through pool, appending each to the manifest as it returns."""
+    units = pending_units(conn, source_name, region, units)
+    if units:
+        record = lambda unit, means: record_unit(conn, source_name, region, means, unit[0], unit[1])
+        fetch_region_means(pool, source_name, geometry, units, region, on_result=record, backend=backend)
+    return units
+
+
+def region_rows(conn, source_name, region, model=None, scenario=None):
+    """Band means of one region of a source run from the manifest, in date order."""
+    rows = conn.execute('SELECT means FROM units WHERE source = ? AND model = ? AND scenario = ? AND region = ? '
+                        'ORDER BY year, month', (source_name, model or '', scenario or '', region))
+    return [json.loads(means) for (means,) in rows]
+
+
+def region_table(conn, source_name, region, model=None, scenario=None):
+    """Per-region table (date index, renamed band columns) from the manifest, or None if it has no units."""
+    rows = region_rows(conn, source_name, region, model, scenario)
+    return to_dataframe(source_name, rows) if rows else None
+
+
+def import_table(conn, source_name, region, path, model=None, scenario=None):
+    """
+    Seed the manifest from a csv or Parquet file written before the manifest existed, so its months are not requested again.
+
+    Old csv files can hold every earlier run one after another. Each run wrote its months in date order, so only the rows after the last place the date goes back (the last run, as kept by `Shorten CSVs.ipynb`) are imported; months that run skipped are left to be requested again. Bands missing from the file are imported as None.
+    """
+    df = read_table(path).reset_index()
+    df = df.iloc[last_run_start(df['date']):]
+    df = df.rename(columns={short: band for band, short in SOURCES[source_name]['rename'].items()})
+    bands = SOURCES[source_name]['bands']
+    for row in df.to_dict('records'):
+        means = {band: (None if pd.isna(row.get(band)) else float(row[band])) for band in bands}
+        means['year'] = row['date'].year
+        means['month'] = row['date'].month
+        conn.execute('INSERT OR IGNORE INTO units VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (source_name, model or '', scenario or '', region, means['year'], means['month'], json.dumps(means)))
+    conn.commit()
+    return len(df)
+
+
+def missing_units(conn, source_name):
+    """All (region, model, scenario, year, month) units of a source missing from the manifest, for every registered region."""
+    regions = [region for (region,) in conn.execute('SELECT region FROM regions ORDER BY rowid')]
+    expected = pd.DataFrame([(region, model or '', scenario or '', year, month)
+                             for region in regions
+                             for model, scenario in SOURCES[source_name]['runs']
+                             for year, month in monthly_units(source_name)],
+                            columns=['region', 'model', 'scenario', 'year', 'month'])
+    done = pd.read_sql_query('SELECT region, model, scenario, year, month FROM units WHERE source = ?', conn,
+                             params=(source_name,))
+    merged = expected.merge(done, how='left', indicator=True)
+    return merged[merged['_merge'] == 'left_only'].drop(columns='_merge').reset_index(drop=True)
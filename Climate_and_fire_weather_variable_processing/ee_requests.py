@@ -0,0 +1,146 @@
+"""
+Shared executor for the Earth Engine requests of the processing and missing-data scripts.
+
+Running several scripts by hand at the same time overloads Earth Engine, and the months that fail are only printed as skipped. A RequestPool sends the requests from a bounded thread pool, so the number in flight is capped, rations them with a token bucket, and retries quota/429 errors with exponential backoff until they succeed. Run one script with more workers rather than several scripts at once.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from extraction_sources import SOURCES, ASPECT_MASK_PATH, postprocess
+
+# Earth Engine errors that clear up by themselves, so are worth retrying (matched case-insensitively)
+RETRYABLE_ERRORS = ('429', 'too many requests', 'too many concurrent', 'quota', 'rate limit', 'resource exhausted',
+                    '503', 'service unavailable', 'deadline exceeded', 'timed out', 'connection')
+
+
+def is_retryable(error):
+    """True for quota, rate limit and transient service errors."""
+    message = str(error).lower()
+    return any(phrase in message for phrase in RETRYABLE_ERRORS)
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing rate requests per second on average, with bursts of up to capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestPool:
+    """
+    Bounded thread pool for Earth Engine requests with a token-bucket rate limit and retries.
+
+    max_workers caps the requests in flight and requests_per_second their rate. Retryable errors are retried up to max_retries times, waiting base_delay * 2**attempt seconds (with jitter, at most max_delay) between attempts.
+    """
+
+    def __init__(self, max_workers=20, requests_per_second=10, max_retries=8, base_delay=2, max_delay=300):
+        self.bucket = TokenBucket(requests_per_second)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def call(self, request, *args):
+        """Run request(*args) under the rate limit, retrying quota errors with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self._count('requests')
+            try:
+                return request(*args)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1))
+
+    def map(self, request, items):
+        """Run request(item) for every item across the pool. Yields (item, result, error) in order, with error None on success."""
+        futures = [self.executor.submit(self.call, request, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+    def shutdown(self):
+        """Wait for the pool to finish and print the request counts."""
+        self.executor.shutdown()
+        print(f"Earth Engine requests: {self.stats['requests']}, retries: {self.stats['retries']}, failures: {self.stats['failures']}")
+
+
+def aspect_mask(source_name):
+    """Aspect band masking the future CMIP6 COGs, or None for sources without one."""
+    import ee  # Imported here so the pool and the mock backend (extraction_backends.py) work without Earth Engine
+    if SOURCES[source_name]['mask'] == 'aspect':
+        return ee.Image.loadGeoTIFF(ASPECT_MASK_PATH).select('aspect')
+    return None
+
+
+def region_month_means(source_name, geometry, year, month, model=None, scenario=None, aspect=None, scale=4000):
+    """Mean of every band of one month of a source over a region in one request, with the unit conversions applied."""
+    import ee
+    from server_side_extraction import masked_image
+    bands = SOURCES[source_name]['bands']
+    image = masked_image(source_name, year, month, model, scenario, aspect)
+    band_means = image.reduceRegion(
+        reducer=ee.Reducer.mean(),
+        geometry=geometry,
+        scale=scale,
+        maxPixels=1e8
+    ).getInfo()
+    means = {band: band_means.get(band) for band in bands}
+    postprocess(source_name, means, year, month)
+    means['year'] = year
+    means['month'] = month
+    return means
+
+
+def fetch_region_means(pool, source_name, geometry, units, label, on_result=None, backend=None):
+    """
+    Band means for a list of (model, scenario, year, month) units of one region, requested concurrently through pool.
+
+    Returns the means in unit order, calling on_result(unit, means) as each one is collected. Units that still fail after the retries (e.g. a missing file) are printed and left out. The requests go to Earth Engine, or to backend if given (see extraction_backends.py).
+    """
+    if backend is None:
+        aspect = aspect_mask(source_name)
+        request = lambda unit: region_month_means(source_name, geometry, unit[2], unit[3], unit[0], unit[1], aspect)
+    else:
+        aspect = backend.aspect_mask(source_name)
+        request = lambda unit: backend.region_month_means(source_name, geometry, unit[2], unit[3], unit[0], unit[1], aspect)
+
+    region_data = []
+    for (model, scenario, year, month), means, error in pool.map(request, units):
+        if error is not None:
+            run = ' '.join(part for part in (model, scenario) if part)
+            print(f"Skipped {year}-{month} for {run + ' ' if run else ''}{label}: {error}")
+            continue
+        if on_result is not None:
+            on_result((model, scenario, year, month), means)
+        region_data.append(means)
+    return region_data
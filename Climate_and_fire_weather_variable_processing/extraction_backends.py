@@ -0,0 +1,153 @@
+"""
+Pluggable backends for the per-region requests of the processing and missing-data scripts.
+
+EarthEngineBackend authenticates and sends the requests to Earth Engine as before. MockBackend is a local stand-in that needs neither an account nor the ee package: it serves band means from synthetic values or small on-disk GeoTIFFs, and simulates latency, quota errors, dropped responses and missing files, so the extraction throughput can be measured and regression-tested offline (`benchmark_extraction.py`). The scripts choose the backend with the EXTRACTION_BACKEND environment variable ('ee' by default, or 'mock').
+"""
+import math
+import os
+import random
+import threading
+import time
+from extraction_sources import SOURCES, image_path, postprocess
+from ee_requests import aspect_mask, region_month_means
+
+NODATA = -9999
+
+
+class EarthEngineBackend:
+    """Requests to Earth Engine, authenticated for project."""
+    name = 'ee'
+
+    def __init__(self, project):
+        import ee
+        ee.Authenticate()
+        ee.Initialize(project=project)
+
+    def regions(self, pool):
+        """The region registry (code -> entry) and a dict of region code -> geometry, in registry order."""
+        import ee
+        from server_side_extraction import selected_regions, ee_registry
+        regions = selected_regions()
+        region_list = regions.toList(regions.size())
+        registry = pool.call(ee_registry, regions)
+        geometries = {code: ee.Feature(region_list.get(entry['index'])).geometry() for code, entry in registry.items()}
+        return registry, geometries
+
+    def aspect_mask(self, source_name):
+        return aspect_mask(source_name)
+
+    def region_month_means(self, source_name, geometry, year, month, model=None, scenario=None, aspect=None):
+        return region_month_means(source_name, geometry, year, month, model, scenario, aspect)
+
+
+class MockError(Exception):
+    """Simulated Earth Engine error."""
+
+
+class MockBackend:
+    """
+    Local stand-in for Earth Engine with simulated latency and failures.
+
+    Each request sleeps latency seconds (varied by +/- jitter as a fraction), then fails with a retryable quota error (quota_error_rate) or a dropped response after a timeout (drop_rate), or with a non-retryable missing file for a fixed missing_rate fraction of the units. Otherwise it returns deterministic synthetic band means, or the band means over the region's bounding box of the file in the local mirror of the bucket if mirror_root is given. The geometries are the region codes.
+    """
+    name = 'mock'
+
+    def __init__(self, latency=0.2, jitter=0.5, quota_error_rate=0.05, drop_rate=0.01, missing_rate=0.0, timeout=2,
+                 mirror_root=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_error_rate = quota_error_rate
+        self.drop_rate = drop_rate
+        self.missing_rate = missing_rate
+        self.timeout = timeout
+        self.mirror_root = mirror_root
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.bboxes = {}
+        self.stats = {'calls': 0, 'quota_errors': 0, 'dropped': 0, 'missing': 0}
+
+    def _draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def regions(self, pool=None):
+        """The cached region registry if there is one (for the bounding boxes), otherwise one built from REGION_PAIRS."""
+        from ecoregion_registry import REGION_PAIRS, GROUP_OF, load_registry
+        try:
+            registry = load_registry()
+        except FileNotFoundError:
+            registry = {code: {'region': code, 'model_code': model_code, 'group': GROUP_OF[code], 'index': i,
+                               'eco_name': code, 'bbox': None} for i, (code, model_code) in enumerate(REGION_PAIRS)}
+        self.bboxes = {code: entry['bbox'] for code, entry in registry.items()}
+        return registry, {code: code for code in registry}
+
+    def aspect_mask(self, source_name):
+        return None
+
+    def region_month_means(self, source_name, geometry, year, month, model=None, scenario=None, aspect=None):
+        """Band means of one month of a source over a region, after a simulated request."""
+        self._count('calls')
+        time.sleep(max(0, self.latency * (1 + self.jitter * (2 * self._draw() - 1))))
+        draw = self._draw()
+        if draw < self.quota_error_rate:
+            self._count('quota_errors')
+            raise MockError('429 Too Many Requests: Earth Engine memory capacity or quota exceeded')
+        if draw < self.quota_error_rate + self.drop_rate:
+            self._count('dropped')
+            time.sleep(self.timeout)
+            raise MockError('Deadline exceeded: response dropped')
+
+        # Missing files are fixed per unit, so retries and later passes can't fill them
+        unit_random = random.Random(f'{self.seed}-{source_name}-{geometry}-{model}-{scenario}-{year}-{month}')
+        if unit_random.random() < self.missing_rate:
+            self._count('missing')
+            raise MockError(f"Image.loadGeoTIFF: file not found: {image_path(source_name, year, month, model, scenario)}")
+
+        bands = SOURCES[source_name]['bands']
+        if self.mirror_root is not None:
+            means = self.file_means(source_name, geometry, year, month, model, scenario)
+        else:
+            # Seasonal cycle with noise, positive for every band
+            season = math.sin(2 * math.pi * (month - 1) / 12)
+            means = {band: 10 + 5 * season + unit_random.gauss(0, 1) for band in bands}
+        postprocess(source_name, means, year, month)
+        means['year'] = year
+        means['month'] = month
+        return means
+
+    def file_means(self, source_name, geometry, year, month, model=None, scenario=None):
+        """Band means over the region's bounding box of the monthly file in the local mirror, with -9999/nodata masked."""
+        import numpy as np
+        import rasterio
+        from rasterio.windows import Window, from_bounds
+        from local_zonal_stats import local_path, band_indexes
+        path = local_path(image_path(source_name, year, month, model, scenario), self.mirror_root)
+        bands = SOURCES[source_name]['bands']
+        with rasterio.open(path) as src:
+            bbox = self.bboxes.get(geometry)
+            window = None
+            if bbox:
+                window = from_bounds(*bbox, transform=src.transform).intersection(Window(0, 0, src.width, src.height))
+            values = src.read(band_indexes(src, bands), window=window, masked=True)
+            values = values.astype('float64').filled(np.nan).reshape(len(bands), -1)
+        values[values == NODATA] = np.nan
+        means = {}
+        for band, band_values in zip(bands, values):
+            valid = band_values[~np.isnan(band_values)]
+            means[band] = float(valid.mean()) if valid.size else None
+        return means
+
+
+def get_backend(project=None, name=None, **options):
+    """The backend named by name or the EXTRACTION_BACKEND environment variable: 'ee' (default) or 'mock' with options."""
+    name = name or os.environ.get('EXTRACTION_BACKEND', 'ee')
+    if name == 'mock':
+        return MockBackend(**options)
+    if name != 'ee':
+        raise ValueError(f"Unknown extraction backend: {name}")
+    return EarthEngineBackend(project)
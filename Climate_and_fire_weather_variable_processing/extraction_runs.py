@@ -0,0 +1,77 @@
+"""
+The extraction passes of the `Process_data` and `Check_for_missing_data` scripts, with the backend, request pool and manifest passed in.
+
+The scripts only set their source, paths and options and call these, so `benchmark_extraction.py` runs the same code paths against the mock backend.
+"""
+import os
+from checkpoint_manifest import register_region, completed_units, import_table, run_units, extract_units, region_table
+from extraction_sources import SOURCES, output_name, existing_table, write_table, append_table
+from gap_scanner import work_units
+
+
+def region_label(short_name, model=None, scenario=None):
+    """Label of one region run for the progress messages, e.g. 'access ssp126 alaspen'."""
+    run = ' '.join(part for part in (model, scenario) if part)
+    return f"{run + ' ' if run else ''}{short_name}"
+
+
+def process_regions(backend, pool, manifest, source_name, registry, geometries, output_dir, output_format='csv',
+                    start=None, end=None, append=False, append_store=False):
+    """
+    Request the months of every run of a source not yet in the manifest for each region of the registry, and write each run's file from the manifest.
+
+    start and end limit the months requested (e.g. '2023-12', '2024-12'). With append, only those months are appended to the existing files, and to the partitioned store with append_store, instead of writing the files again.
+    """
+    for short_name, region in registry.items():
+        register_region(manifest, short_name, region['eco_name'])
+
+        for model, scenario in SOURCES[source_name]['runs']:
+            label = region_label(short_name, model, scenario)
+            print(f"Extracting {label}")
+            extract_units(pool, manifest, source_name, geometries[short_name], short_name,
+                          run_units(source_name, model, scenario, start, end), backend)
+
+            df = region_table(manifest, source_name, short_name, model, scenario)
+            if df is None:
+                print(f"No data extracted for region: {label}")
+                continue
+            file_name = output_name(source_name, short_name, model, scenario)
+            output_path = os.path.join(output_dir, file_name)
+            if not append:
+                write_table(df, output_path, output_format)
+                continue
+
+            # Append only the new months, leaving the existing rows as they are
+            df = df.loc[start:end]
+            print(f"{label}: appended {append_table(df, output_path, output_format)} months")
+            if append_store:
+                from ecoregion_store import append_to_store, parse_file_name
+                append_to_store(df, *parse_file_name(file_name))
+
+
+def fill_gaps(backend, pool, manifest, source_name, registry, geometries, worklist, output_dir, output_format='csv'):
+    """
+    Request the missing units of a gap_scanner work list of a source and write each affected file again from the manifest.
+
+    Files written before the manifest existed are imported into it first, so only the months they lack are requested.
+    """
+    for (short_name, model, scenario), missing_units in work_units(worklist).items():
+        register_region(manifest, short_name, registry[short_name]['eco_name'])
+        label = region_label(short_name, model, scenario)
+        output_path = os.path.join(output_dir, output_name(source_name, short_name, model, scenario))
+
+        # Import a csv or Parquet file written before the manifest existed
+        existing_path = existing_table(output_path)
+        if existing_path and not completed_units(manifest, source_name, short_name, model, scenario):
+            import_table(manifest, source_name, short_name, existing_path, model, scenario)
+
+        # Months already in the manifest are written without requesting them again
+        print(f"Filling missing months for {label}: {', '.join(f'{year}-{month:02d}' for _, _, year, month in missing_units)}")
+        extract_units(pool, manifest, source_name, geometries[short_name], short_name, missing_units, backend)
+
+        df = region_table(manifest, source_name, short_name, model, scenario)
+        if df is not None:
+            write_table(df, output_path, output_format)
+            print(f"Updated file saved for {label}")
+        else:
+            print(f"No new data could be retrieved for {label}")
@@ -0,0 +1,224 @@
+"""
+Definitions of the ERA5-Land, CEMS and NASA-downscaled CMIP6 sources processed to csv files for each ecoregion, shared by the processing scripts.
+
+Each source gives the monthly GeoTIFF path template, bands, masking, post-processing and output csv name exactly as in the individual `Process_data` scripts.
+"""
+import os
+import sys
+from calendar import monthrange
+import numpy as np
+import pandas as pd
+# The repository root, for the ecoregion registry and store modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODELS_LONG = {'access': 'ACCESS-CM2', 'mri': 'MRI-ESM2-0'}
+MODELS = ['access', 'mri']
+SCENARIOS = ['ssp126', 'ssp245', 'ssp370']
+
+# Aspect band used to mask the future CMIP6 COGs to the training footprint
+ASPECT_MASK_PATH = 'gs://clelland_fire_ml/training_nasa_access_firecci/nasa_access_firecci_2001_1.tif' # <-- Check permission
+
+_E5L_BANDS = ['relative_humidity', 'total_precipitation_sum', 'surface_thermal_radiation_downwards_sum',
+              'surface_solar_radiation_downwards_sum', 'u_component_of_wind_10m', 'temperature_2m',
+              'temperature_2m_max', 'temperature_2m_min']
+_CEMS_BANDS = ['build_up_index', 'drought_code', 'duff_moisture_code', 'fine_fuel_moisture_code', 'fire_weather_index',
+               'initial_fire_spread_index']
+
+# month_seconds: band -> (operator, factor) applied with the number of seconds in the month, e.g. ('*', 0.001) is value * seconds * 0.001
+SOURCES = {
+    'e5l': {
+        'path': 'gs://clelland_fire_ml/training_e5l_cems_mcd/cems_e5l_mcd_{year}_{month}.tif',
+        'bands': _E5L_BANDS,
+        'rename': {"relative_humidity": "rh", "total_precipitation_sum": "tp", "surface_thermal_radiation_downwards_sum": "rlds",
+                   "surface_solar_radiation_downwards_sum": "rsds", "u_component_of_wind_10m": "wsp", "temperature_2m": "t2m",
+                   "temperature_2m_max": "mx2t", "temperature_2m_min": "mn2t"},
+        'month_seconds': {'total_precipitation_sum': ('*', 1), 'surface_thermal_radiation_downwards_sum': ('/', 1),
+                          'surface_solar_radiation_downwards_sum': ('/', 1)},
+        'mask': 'nodata',
+        'start': '2001-01', 'end': '2023-11',
+        'runs': [(None, None)],
+        'output': 'e5l_2001_2023_{short_name}.csv'
+    },
+    'cems': {
+        'path': 'gs://clelland_fire_ml/training_e5l_cems_mcd/cems_e5l_mcd_{year}_{month}.tif',
+        'bands': _CEMS_BANDS,
+        'rename': {"build_up_index": "BUI", "drought_code": "DC", "duff_moisture_code": "DMC", "fine_fuel_moisture_code": "FFMC",
+                   "fire_weather_index": "FWI", "initial_fire_spread_index": "ISI"},
+        'month_seconds': {},
+        'mask': 'nodata',
+        'start': '2001-01', 'end': '2023-11',
+        'runs': [(None, None)],
+        'output': 'cems_2001_2023_{short_name}.csv'
+    },
+    'cmip_hist_climate': {
+        'path': 'gs://clelland_fire_ml/training_nasa_{model}_firecci/nasa_{model}_firecci_{year}_{month}.tif',
+        'bands': ['hurs', 'pr', 'rlds', 'rsds', 'sfcWind', 'tas', 'tasmax', 'tasmin'],
+        'rename': {"hurs": "rh"},
+        'month_seconds': {'pr': ('*', 0.001)},
+        'mask': 'nodata',
+        'start': '2001-01', 'end': '2014-12',
+        'runs': [(model, None) for model in MODELS],
+        'output': '{model}_climate_2001_2014_{short_name}.csv'
+    },
+    'cmip_hist_fwi': {
+        'path': 'gs://clelland_fire_ml/training_nasa_{model}_firecci/nasa_{model}_firecci_{year}_{month}.tif',
+        'bands': ['BUI', 'DC', 'DMC', 'FFMC', 'FWI', 'ISI'],
+        'rename': {},
+        'month_seconds': {},
+        'mask': 'nodata',
+        'start': '2001-01', 'end': '2014-12',
+        'runs': [(model, None) for model in MODELS],
+        'output': '{model}_fwi_2001_2014_{short_name}.csv'
+    },
+    'cmip_future_climate': {
+        'path': 'gs://clelland_fire_ml/CMIP6_files/{model_long}_COG/{folder}/{model_long}_{scenario}_{year}_{month}_all_cog.tif',
+        'bands': ['B0', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8'],
+        'rename': {"B0": "rh", "B2": "tp", "B3": "rlds", "B4": "rsds", "B5": "wsp", "B6": "t2m", "B7": "mx2t", "B8": "mn2t"},
+        'month_seconds': {'B2': ('*', 0.001)},
+        'mask': 'aspect',
+        'start': '2015-01', 'end': '2100-12',
+        'runs': [(model, scenario) for model in MODELS for scenario in SCENARIOS],
+        'output': '{model}_{scenario}_climate_2015_2100_{short_name}.csv'
+    },
+    'cmip_future_fwi': {
+        'path': 'gs://clelland_fire_ml/FWI_files/{model_long}_COG/{folder}/{model_long}_{scenario}_{year}_{month}_cog.tif',
+        'bands': ['B0', 'B1', 'B2', 'B3', 'B4', 'B10'],
+        'rename': {"B0": "BUI", "B1": "DC", "B2": "DMC", "B3": "FFMC", "B4": "FWI", "B10": "ISI"},
+        'month_seconds': {},
+        'mask': 'aspect',
+        'start': '2015-01', 'end': '2100-12',
+        'runs': [(model, scenario) for model in MODELS for scenario in SCENARIOS],
+        'output': '{model}_{scenario}_fwi_2015_2100_{short_name}.csv'
+    }
+}
+
+
+def run_label(model=None, scenario=None):
+    """Label for one model/scenario run of a source, e.g. 'access_ssp126', or 'all' for the observed sources."""
+    return '_'.join(part for part in (model, scenario) if part) or 'all'
+
+
+def monthly_units(source_name, start=None, end=None):
+    """All (year, month) pairs of a source, or of the months from start to end (e.g. '2023-12', '2024-12') if given."""
+    source = SOURCES[source_name]
+    dates = pd.date_range(start=start or source['start'], end=end or source['end'], freq='MS')
+    return [(int(year), int(month)) for year, month in zip(dates.year, dates.month)]
+
+
+def image_path(source_name, year, month, model=None, scenario=None):
+    """Path of the monthly GeoTIFF for a source."""
+    return SOURCES[source_name]['path'].format(year=year, month=month, model=model, scenario=scenario,
+                                               model_long=MODELS_LONG.get(model), folder=(scenario or '').upper())
+
+
+def output_name(source_name, short_name, model=None, scenario=None):
+    """csv file name for one region of a source run."""
+    return SOURCES[source_name]['output'].format(short_name=short_name, model=model, scenario=scenario)
+
+
+def postprocess(source_name, means, year, month):
+    """Apply the unit conversions that depend on the month length to one dict of band means, in place."""
+    _, last_day = monthrange(year, month)
+    for band, (operator, factor) in SOURCES[source_name]['month_seconds'].items():
+        if means[band] is None:
+            continue
+        seconds = last_day * 24 * 60 * 60
+        if factor != 1:
+            seconds = seconds * factor
+        if operator == '*':
+            means[band] *= seconds
+        else:
+            means[band] /= seconds
+    return means
+
+
+def postprocess_frame(source_name, df):
+    """Vectorised postprocess for a table with year, month and band columns."""
+    df = df.copy()
+    last_days = np.array([monthrange(year, month)[1] for year, month in zip(df['year'], df['month'])])
+    for band, (operator, factor) in SOURCES[source_name]['month_seconds'].items():
+        seconds = last_days * 24 * 60 * 60
+        if factor != 1:
+            seconds = seconds * factor
+        if operator == '*':
+            df[band] = df[band] * seconds
+        else:
+            df[band] = df[band] / seconds
+    return df
+
+
+def to_dataframe(source_name, rows):
+    """Build the per-region table (date index, renamed band columns) from rows of band means with year and month."""
+    source = SOURCES[source_name]
+    df = pd.DataFrame(rows)
+    df['date'] = pd.to_datetime(df[['year', 'month']].assign(day=1))
+    df.set_index('date', inplace=True)
+    df.drop(columns=['year', 'month'], inplace=True)
+    df.rename(columns=source['rename'], inplace=True)
+    return df
+
+
+def table_path(path, output_format):
+    """path with the file extension of output_format ('parquet' or 'csv')."""
+    return os.path.splitext(path)[0] + ('.parquet' if output_format == 'parquet' else '.csv')
+
+
+def existing_table(path):
+    """The Parquet or csv version of path that exists (Parquet first), or None."""
+    for output_format in ('parquet', 'csv'):
+        candidate = table_path(path, output_format)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def write_table(df, path, output_format='csv'):
+    """Write a per-region table as csv or as Parquet (columnar, typed date index). Returns the path written."""
+    path = table_path(path, output_format)
+    if output_format == 'parquet':
+        df.to_parquet(path)
+    else:
+        df.to_csv(path)
+    return path
+
+
+def append_table(df, path, output_format='csv'):
+    """
+    Append the months of df later than the last month of the per-region table at path, creating it if there is none. Returns the number of months appended.
+
+    A csv file is appended to in place, in the column order of its header, so the existing rows are never rewritten. Parquet files can't be appended to, so a Parquet table is written again with the new months after the existing rows.
+    """
+    path = existing_table(path) or table_path(path, output_format)
+    if not os.path.exists(path):
+        write_table(df.sort_index(), path, output_format)
+        return len(df)
+    if path.endswith('.parquet'):
+        existing = pd.read_parquet(path)
+        new = df[df.index > existing.index.max()].sort_index()
+        if len(new):
+            pd.concat([existing, new]).to_parquet(path)
+        return len(new)
+    header = pd.read_csv(path, nrows=0, index_col='date').columns
+    last = pd.read_csv(path, usecols=['date'], parse_dates=['date'])['date'].max()
+    new = df[df.index > last].sort_index()
+    if len(new):
+        new.reindex(columns=header).to_csv(path, mode='a', header=False)
+    return len(new)
+
+
+def last_run_start(dates):
+    """
+    Position of the first row of the last run in the date column of a per-region file (0 for a file with one run).
+
+    Old csv files hold every earlier run one after another, each in date order, so the last run starts after the last place the date goes back.
+    """
+    dates = pd.Series(pd.to_datetime(dates)).reset_index(drop=True)
+    run_starts = dates.index[dates.diff() <= pd.Timedelta(0)]
+    return int(run_starts[-1]) if len(run_starts) else 0
+
+
+def read_table(path):
+    """Read a per-region table written by write_table, indexed by date."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=['date'], index_col='date')
@@ -0,0 +1,68 @@
+"""
+Vectorised scan of the per-region csv/Parquet files for missing months, without Earth Engine or the manifest.
+
+For each file, the expected monthly DatetimeIndex of its source run is diffed against the file's date index in one operation (only the dates are read). The result is a compact work list of the missing (region, model, scenario, year, month) units. The missing-data scripts only start Earth Engine for the units on the list, so a pass over complete files takes seconds.
+"""
+import os
+import pandas as pd
+from extraction_sources import SOURCES, output_name, existing_table, last_run_start
+
+WORKLIST_COLUMNS = ['source', 'region', 'model', 'scenario', 'year', 'month']
+
+
+def expected_dates(source_name, start=None, end=None):
+    """Monthly DatetimeIndex every file of a source should have, or only its months from start to end if given."""
+    source = SOURCES[source_name]
+    return pd.date_range(start=start or source['start'], end=end or source['end'], freq='MS')
+
+
+def file_dates(path):
+    """
+    Date index of a per-region csv or Parquet file, reading only the dates.
+
+    Old csv files holding earlier runs repeat dates, so only the last run's dates are kept, by the same rule as `checkpoint_manifest.import_table`: a month that run missed is a gap even if an earlier run covered it.
+    """
+    if path.endswith('.parquet'):
+        dates = pd.DatetimeIndex(pd.read_parquet(path, columns=[]).index)
+    else:
+        dates = pd.DatetimeIndex(pd.read_csv(path, usecols=['date'], parse_dates=['date'])['date'])
+    return dates[last_run_start(dates):]
+
+
+def scan_gaps(source_name, output_dir, regions, start=None, end=None):
+    """
+    Work list of the months missing from the files of a source in output_dir, for the given region codes (and only the months from start to end if given).
+
+    A missing file counts as missing every month. model and scenario are '' for the observed sources.
+    """
+    expected = expected_dates(source_name, start, end)
+    frames = []
+    for region in regions:
+        for model, scenario in SOURCES[source_name]['runs']:
+            path = existing_table(os.path.join(output_dir, output_name(source_name, region, model, scenario)))
+            missing = expected if path is None else expected.difference(file_dates(path))
+            if len(missing):
+                frames.append(pd.DataFrame({'source': source_name, 'region': region, 'model': model or '',
+                                            'scenario': scenario or '', 'year': missing.year, 'month': missing.month}))
+    if not frames:
+        return pd.DataFrame(columns=WORKLIST_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def work_units(worklist):
+    """Dict of (region, model, scenario) -> (model, scenario, year, month) units to request, from a work list."""
+    units = {}
+    for (region, model, scenario), group in worklist.groupby(['region', 'model', 'scenario'], sort=False):
+        model, scenario = model or None, scenario or None
+        units[(region, model, scenario)] = [(model, scenario, int(year), int(month))
+                                            for year, month in zip(group['year'], group['month'])]
+    return units
+
+
+def print_worklist(worklist):
+    """Print the number of missing months of each region run of a work list."""
+    counts = worklist.groupby(['source', 'region', 'model', 'scenario'], sort=False).size()
+    print(f"{len(worklist)} missing months in {len(counts)} files")
+    for (source_name, region, model, scenario), count in counts.items():
+        run = ' '.join(part for part in (model, scenario) if part)
+        print(f"    {source_name} {run + ' ' if run else ''}{region}: {count}")
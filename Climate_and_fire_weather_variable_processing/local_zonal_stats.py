@@ -0,0 +1,177 @@
+"""
+Local zonal statistics over a filesystem mirror of the monthly GeoTIFF/COG bucket, as an alternative to the Earth Engine requests.
+
+The ecoregions are rasterised once onto the grid of a source as an integer label raster, cached with the helpers of `netCDF_processing/region_labels.py`. Each monthly file is then read one internal block at a time, skipping the blocks without region pixels, and the sums and counts of every band are accumulated for every region with `np.bincount`, so one read of a file gives the band means of all the ecoregions. The masking follows `server_side_extraction.masked_image`: the file's nodata and -9999 are masked, and the future CMIP6 files are also masked by the aspect band. Pixels belong to the region containing their centre, so the means can differ slightly from Earth Engine's area-weighted `reduceRegion` at the polygon edges.
+"""
+import os
+import sys
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rasterio
+from rasterio import features
+from rasterio.errors import RasterioIOError
+from rasterio.warp import reproject, Resampling
+from extraction_sources import SOURCES, ASPECT_MASK_PATH, image_path, postprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'netCDF_processing'))
+from region_labels import load_cached
+
+NODATA = -9999
+
+_worker_state = {}
+
+
+def local_path(path, mirror_root):
+    """Path of a gs:// object in the local mirror of the bucket (mirror_root/bucket/...)."""
+    if path.startswith('gs://'):
+        return os.path.join(mirror_root, path[len('gs://'):])
+    return path
+
+
+def band_indexes(src, bands):
+    """1-based indexes of the named bands of an open file, by band description or by Earth Engine's B<i> names."""
+    descriptions = list(src.descriptions)
+    indexes = []
+    for band in bands:
+        if band in descriptions:
+            indexes.append(descriptions.index(band) + 1)
+        elif band[0] == 'B' and band[1:].isdigit():
+            indexes.append(int(band[1:]) + 1)
+        else:
+            raise ValueError(f"Band {band} not found in {src.name}")
+    return indexes
+
+
+def grid_coordinates(transform, shape):
+    """Cell-centre y and x coordinates of a north-up grid."""
+    ys = transform.f + transform.e * (np.arange(shape[0]) + 0.5)
+    xs = transform.c + transform.a * (np.arange(shape[1]) + 0.5)
+    return ys, xs
+
+
+def rasterise_labels(region_gdfs, transform, shape, crs):
+    """Burn each region onto the grid by pixel centre, as label i + 1 for the i-th region (0 outside all regions)."""
+    shapes = []
+    for label, region_gdf in enumerate(region_gdfs.values(), start=1):
+        region_gdf = region_gdf.to_crs(crs)
+        shapes.extend((geom, label) for geom in region_gdf.geometry.values if geom is not None and not geom.is_empty)
+    return features.rasterize(shapes, out_shape=shape, transform=transform, fill=0, all_touched=False, dtype='int32')
+
+
+def aspect_valid(aspect_path, transform, shape, crs):
+    """Pixels kept by the aspect band mask (non-zero, not nodata), resampled onto the grid by nearest neighbour."""
+    aspect = np.full(shape, np.nan, dtype='float32')
+    with rasterio.open(aspect_path) as src:
+        reproject(rasterio.band(src, band_indexes(src, ['aspect'])[0]), aspect, dst_transform=transform, dst_crs=crs,
+                  dst_nodata=np.nan, resampling=Resampling.nearest)
+    return ~np.isnan(aspect) & (aspect != 0)
+
+
+def load_grid(source_name, sample_path, region_gdfs, cache_path, mirror_root):
+    """
+    Label raster (and aspect mask for the future CMIP6 sources) on the grid of sample_path, cached in cache_path.
+
+    Returns the worker state: labels, aspect, the grid transform and shape, and the blocks of the file that hold region pixels.
+    """
+    with rasterio.open(sample_path) as src:
+        transform, shape, crs = src.transform, src.shape, src.crs
+        windows = [window for _, window in src.block_windows(1)]
+
+    def build(gdfs, ys, xs):
+        arrays = {'labels': rasterise_labels(gdfs, transform, shape, crs)}
+        if SOURCES[source_name]['mask'] == 'aspect':
+            arrays['aspect'] = aspect_valid(local_path(ASPECT_MASK_PATH, mirror_root), transform, shape, crs)
+        return arrays
+
+    ys, xs = grid_coordinates(transform, shape)
+    arrays = load_cached(cache_path, region_gdfs, ys, xs, build, 'label raster')
+    labels = arrays['labels']
+    return {'labels': labels, 'aspect': arrays.get('aspect'), 'transform': transform, 'shape': shape,
+            'n_regions': len(region_gdfs), 'bands': SOURCES[source_name]['bands'],
+            'windows': [window for window in windows if labels[window.toslices()].any()]}
+
+
+def file_means(path, state):
+    """
+    Mean of every band over every region from one read of a file, as an (n_regions, n_bands) array.
+
+    Regions without any valid pixels are NaN.
+    """
+    labels, aspect, n_regions, bands = state['labels'], state['aspect'], state['n_regions'], state['bands']
+    sums = np.zeros((len(bands), n_regions + 1))
+    counts = np.zeros((len(bands), n_regions + 1))
+    with rasterio.open(path) as src:
+        if src.shape != state['shape'] or src.transform != state['transform']:
+            raise ValueError(f"{path} is not on the grid of the label raster")
+        indexes = band_indexes(src, bands)
+        for window in state['windows']:
+            rows_cols = window.toslices()
+            block_labels = labels[rows_cols].ravel()
+            inside = block_labels > 0
+            values = src.read(indexes, window=window, masked=True).astype('float64').filled(np.nan)
+            values = values.reshape(len(bands), -1)[:, inside]
+            valid = ~np.isnan(values) & (values != NODATA)
+            if aspect is not None:
+                valid &= aspect[rows_cols].ravel()[inside]
+            block_labels = block_labels[inside]
+            for b in range(len(bands)):
+                sums[b] += np.bincount(block_labels, weights=np.where(valid[b], values[b], 0.0), minlength=n_regions + 1)
+                counts[b] += np.bincount(block_labels, weights=valid[b], minlength=n_regions + 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return means[:, 1:].T
+
+
+def _init_worker(state):
+    """Keep the label raster and masks in each worker so they are only sent once per process."""
+    _worker_state.update(state)
+
+
+def _process_unit(path):
+    try:
+        return file_means(path, _worker_state), None
+    except (RasterioIOError, ValueError) as e:
+        return None, e
+
+
+def zonal_means(source_name, units, region_gdfs, mirror_root, cache_path, n_workers=1):
+    """
+    Band means of every region for (model, scenario, year, month) units of a source, from the local mirror.
+
+    Yields (unit, {region: means}) in unit order, where means is a dict of band means (None where a region has no valid pixels) with year and month and the unit conversions applied, as from Earth Engine. Units whose file is missing or unreadable are printed and left out.
+    """
+    if not units:
+        return
+    paths = [local_path(image_path(source_name, year, month, model, scenario), mirror_root)
+             for model, scenario, year, month in units]
+    state = load_grid(source_name, paths[0], region_gdfs, cache_path, mirror_root)
+    bands = state['bands']
+    names = list(region_gdfs)
+
+    executor = None
+    if n_workers > 1:
+        # Fork so the workers inherit the label raster without pickling it per task
+        executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context('fork'),
+                                       initializer=_init_worker, initargs=(state,))
+        results = executor.map(_process_unit, paths)
+    else:
+        _init_worker(state)
+        results = map(_process_unit, paths)
+
+    try:
+        for (model, scenario, year, month), path, (means, error) in zip(units, paths, results):
+            if error is not None:
+                print(f"Skipped {year}-{month} for {path}: {error}")
+                continue
+            region_means = {}
+            for name, row in zip(names, means):
+                region_mean = {band: (None if np.isnan(value) else float(value)) for band, value in zip(bands, row)}
+                postprocess(source_name, region_mean, year, month)
+                region_mean['year'] = year
+                region_mean['month'] = month
+                region_means[name] = region_mean
+            yield (model, scenario, year, month), region_means
+    finally:
+        if executor is not None:
+            executor.shutdown()
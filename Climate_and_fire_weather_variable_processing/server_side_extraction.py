@@ -0,0 +1,129 @@
+"""
+Helpers to compute the ecoregion time series server-side in Google Earth Engine.
+
+Rather than one reduceRegion request per region and month, the monthly GeoTIFFs of a source run are built into an ee.ImageCollection and reduceRegions is mapped over it, so every region-month mean is computed by Earth Engine in one batch export. The exported table is then split into the per-region csv files with the same columns as the `Process_data` scripts.
+"""
+import os
+import time
+import ee
+import pandas as pd
+from extraction_sources import (SOURCES, ASPECT_MASK_PATH, monthly_units, image_path, output_name, postprocess_frame,
+                                to_dataframe, run_label, write_table)
+from ecoregion_registry import REGISTRY_PATH, build_registry, load_registry
+
+
+def selected_regions():
+    """The boreal forest and tundra ecoregions of the Nearctic and Palearctic."""
+    ecoRegions = ee.FeatureCollection('RESOLVE/ECOREGIONS/2017')
+    biome_filter = ee.Filter.inList('BIOME_NUM', [6, 11])
+    realm_filter = ee.Filter.inList('REALM', ['Nearctic', 'Palearctic'])
+    return ecoRegions.filter(ee.Filter.And(biome_filter, realm_filter))
+
+
+def ee_registry(regions=None, registry_path=REGISTRY_PATH):
+    """
+    The cached ecoregion registry, built from Earth Engine if it does not exist yet.
+
+    The names and bounding boxes of all the regions are fetched in one request rather than a `getInfo()` per feature.
+    """
+    if os.path.exists(registry_path):
+        return load_registry(registry_path)
+    regions = regions if regions is not None else selected_regions()
+    summaries = regions.map(lambda feature: ee.Feature(None, {
+        'ECO_NAME': feature.get('ECO_NAME'),
+        'bounds': feature.geometry().bounds(1000).coordinates().get(0)
+    })).getInfo()['features']
+    eco_names = [summary['properties']['ECO_NAME'] for summary in summaries]
+    bounds = []
+    for summary in summaries:
+        lons, lats = zip(*summary['properties']['bounds'])
+        bounds.append([min(lons), min(lats), max(lons), max(lats)])
+    return build_registry(eco_names, bounds, registry_path)
+
+
+def masked_image(source_name, year, month, model=None, scenario=None, aspect=None):
+    """Load one monthly GeoTIFF with the same masking as the processing scripts."""
+    image = ee.Image.loadGeoTIFF(image_path(source_name, year, month, model, scenario))
+    if SOURCES[source_name]['mask'] == 'aspect':
+        image = image.unmask(-9999, sameFootprint=True).updateMask(aspect)
+    image = image.updateMask(image.neq(-9999))
+    return image.select(SOURCES[source_name]['bands'])
+
+
+def build_collection(source_name, model=None, scenario=None):
+    """ImageCollection of every month of a source run, with year and month properties."""
+    aspect = None
+    if SOURCES[source_name]['mask'] == 'aspect':
+        aspect = ee.Image.loadGeoTIFF(ASPECT_MASK_PATH).select('aspect')
+    images = [masked_image(source_name, year, month, model, scenario, aspect).set({'year': year, 'month': month})
+              for year, month in monthly_units(source_name)]
+    return ee.ImageCollection.fromImages(images)
+
+
+def reduce_collection(collection, regions, scale=4000):
+    """Mean of every band for every region and image, as a flat FeatureCollection without geometries."""
+    regions = regions.select(['ECO_NAME'])
+
+    def reduce_image(image):
+        reduced = image.reduceRegions(collection=regions, reducer=ee.Reducer.mean(), scale=scale)
+        return reduced.map(lambda feature: feature.set({'year': image.get('year'), 'month': image.get('month')})
+                           .setGeometry(None))
+
+    return ee.FeatureCollection(collection.map(reduce_image)).flatten()
+
+
+def table_name(source_name, model=None, scenario=None):
+    """Name of the exported table for a source run."""
+    return f"{source_name}_{run_label(model, scenario)}_ecoregions"
+
+
+def export_table(source_name, regions, bucket, prefix, model=None, scenario=None, scale=4000):
+    """Start the batch export of one source run to Cloud Storage as a csv table. Returns the started task."""
+    table = reduce_collection(build_collection(source_name, model, scenario), regions, scale)
+    name = table_name(source_name, model, scenario)
+    task = ee.batch.Export.table.toCloudStorage(
+        collection=table,
+        description=name,
+        bucket=bucket,
+        fileNamePrefix=f"{prefix}/{name}",
+        fileFormat='CSV',
+        selectors=['ECO_NAME', 'year', 'month'] + SOURCES[source_name]['bands']
+    )
+    task.start()
+    return task
+
+
+def wait_for_tasks(tasks, poll_seconds=60):
+    """Block until all export tasks have finished, printing any that fail."""
+    pending = list(tasks)
+    while pending:
+        time.sleep(poll_seconds)
+        still_running = []
+        for task in pending:
+            status = task.status()
+            if status['state'] in ('READY', 'RUNNING'):
+                still_running.append(task)
+            elif status['state'] != 'COMPLETED':
+                print(f"Export {status['description']} {status['state']}: {status.get('error_message')}")
+            else:
+                print(f"Export {status['description']} completed")
+        pending = still_running
+
+
+def split_table(table_path, source_name, output_dir, model=None, scenario=None, output_format='csv'):
+    """
+    Write the per-region csv (or Parquet) files of one source run from its exported table.
+
+    Applies the month-length unit conversions and band renames of the processing scripts, so each file has a date index and the same columns. table_path can be a local copy or a gs:// path (with gcsfs installed).
+    """
+    bands = SOURCES[source_name]['bands']
+    table = postprocess_frame(source_name, pd.read_csv(table_path))
+    table['short_name'] = table['ECO_NAME'].map(short_name)
+
+    output_paths = []
+    for region_name, region_table in table.groupby('short_name', sort=False):
+        region_table = region_table.sort_values(['year', 'month'])
+        df = to_dataframe(source_name, region_table[bands + ['year', 'month']].reset_index(drop=True))
+        output_path = os.path.join(output_dir, output_name(source_name, region_name, model, scenario))
+        output_paths.append(write_table(df, output_path, output_format))
+    return output_paths
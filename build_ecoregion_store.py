@@ -0,0 +1,15 @@
+"""
+Consolidate the per-ecoregion climate and fire weather csv/Parquet files into the partitioned Parquet store (region/source/model/scenario) read by `ecoregion_store.load`.
+
+Edit as necessary, but maintain consistency with other code.
+"""
+from ecoregion_store import build_store, STORE_PATH
+
+# Folder holding the per-region files, flat or in one folder per region
+csv_root = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs' # <-- Edit as necessary
+
+# None for every region found, or a list of region codes to rebuild only those partitions
+regions = None # <-- Edit as necessary
+
+keys = build_store(csv_root, STORE_PATH, regions)
+print(f"Saved {len(keys)} time series for {len({key[0] for key in keys})} regions to {STORE_PATH}")
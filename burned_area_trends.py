@@ -0,0 +1,36 @@
+"""
+Mann-Kendall trend tests and Sen's slopes of the annual burned area of every ecoregion, region group and model, saved as one tidy csv table.
+
+Uses the vectorised tests of `trend_tests.py` in place of the `pymannkendall.original_test` loops of `Grouped ecoregions analysis.ipynb`, for all regions together rather than one hand-edited `region_mappings` subset at a time.
+
+Edit as necessary, but maintain consistency with other code.
+"""
+import time
+import numpy as np
+from ecoregion_registry import REGION_PAIRS
+from trend_tests import load_burned_area, group_totals, trend_table
+
+# Seasons summed for each year: None for the whole year, or a list of months
+seasons = {'Annual': None, 'Fire season': [5, 6, 7, 8, 9]} # <-- Edit as necessary
+
+# Fixed periods of years (None for the whole record), and moving windows as (length, step) in years (None for none)
+periods = [(2025, 2100), (2025, 2050), (2051, 2075), (2076, 2100)] # <-- Edit as necessary
+window = (30, 5) # <-- Edit as necessary
+
+# Fewest years with data for a test to be reported, and the significance level
+min_years = 10 # <-- Edit as necessary
+alpha = 0.05 # <-- Edit as necessary
+
+output_path = '/home/users/clelland/Model/Analysis/Summary stats/BA/mk_trends.csv' # <-- Edit as necessary
+
+start = time.perf_counter()
+cube, dates, regions = load_burned_area(REGION_PAIRS)
+
+# The region groups (N America boreal, Eurasia boreal, tundra) and all regions, as summed in the notebooks
+totals, groups = group_totals(cube, regions)
+cube = np.concatenate([cube, totals])
+
+df = trend_table(cube, dates, regions + groups, seasons=seasons, periods=periods, window=window, min_years=min_years,
+                 alpha=alpha)
+df.to_csv(output_path, index=False)
+print(f"Saved {len(df)} trend tests to {output_path} in {time.perf_counter() - start:.1f} s")
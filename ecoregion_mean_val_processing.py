@@ -1,10 +1,18 @@
 """
 For each ecoregion, create grouped means and percentage changes compared to the historical observed period for each variable over the time periods 2025-2050, 2051-2075 and 2076-2100, then save as csv files for analysis.
 
+The regions are read in a process pool and their time series cached, then summarised together straight into `master_summary.csv`; the per-region files are optional. In incremental mode only the regions whose input files changed since the last run are read again, so changing the periods, baseline or bias window only needs the cache.
+In a notebook, `SummaryCache.load(cache_dir, regions).summary_table(periods, baseline, bias_window)` gives the same table, and memoises the intermediates for quick reruns.
+
 Edit as necessary, but maintain consistency with other code.
 """
-import pandas as pd
+import multiprocessing as mp
 import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from ecoregion_registry import REGION_PAIRS
+from summary_kernel import (SummaryCache, build_cube, save_cube, file_fingerprint, load_fingerprints,
+                            save_fingerprints, stale_regions)
 
 # Define your variables and time periods
 climate_vars = ['rh', 'tp', 'rlds', 'rsds', 'wsp', 't2m', 'mx2t', 'mn2t']
@@ -16,7 +24,9 @@ periods = {
     '2025_2050': ('2025-01-01', '2050-12-31'),
     '2051_2075': ('2051-01-01', '2075-12-31'),
     '2076_2100': ('2076-01-01', '2100-12-31')
-}
+} # <-- Edit as necessary
+baseline = 'historical' # <-- Edit as necessary - period of the observed mean the percentage changes are relative to
+bias_window = ('2015-01-01', '2023-12-31') # <-- Edit as necessary - months the monthly model biases are averaged over
 
 # Model mapping
 model_groups = {
@@ -24,133 +34,129 @@ model_groups = {
             'MRI_SSP126', 'MRI_SSP245', 'MRI_SSP370']
 }
 
-# Provide region list as tuples: (region_code, region_model_code) - consistency with previous scripts
-region_pairs = [('alaspen', 'alapen'), ('centcan', 'cancsh'), ('cookinl', 'cookin'), ('copppla', 'copper'), ('eastcan', 'eastcf'), ('eashti', 'eashti'),
-               ('inteala', 'intlow'), ('mid-bor', 'midbor'), ('midwcan', 'midwes'), ('musklak', 'muslta'), ('nortcan', 'norths'), ('southud', 'sohudb'),
-               ('watshig', 'watson'), ('nortcor', 'norcor'), ('nortter', 'nwterr'), ('eastsib', 'eastsib'), ('icelbor', 'icelnd'), ('kamcmea', 'kamkurm'),
-               ('kamctai', 'kamtaig'), ('nesibta', 'nesibta'), ('okhotai', 'okhman'), ('sakhisl', 'sakhtai'), ('trancon', 'trzconf'), ('westsib', 'westsib'),
-               ('scanand', 'scrusta'), ('uralmon', 'uralfor'), ('ahkland', 'ahklun'), ('berilow', 'berlow'), ('brooran', 'brookr'), ('kalanun', 'kalhar'),
-               ('pacicoa', 'pacice'), ('novoisl', 'novoisl'), ('wranisl', 'wrangel'), ('alaseli', 'aleias'), ('arctcoa', 'arccoa'), ('arctfoo', 'arcfoo'),
-               ('beriupl', 'berupl'), ('canalow', 'canlow'), ('davihig', 'davish'), ('canahig', 'canhig'), ('inteyuk', 'intalp'), ('canamid', 'canmid'),
-               ('ogilalp', 'ogilvi'), ('tornmou', 'tornga'), ('kalste', 'kalste'), ('russarc', 'rusarc'), ('russber', 'rusbert'), ('chermou', 'cherski'),
-               ('chukpen', 'chukchi'), ('kolapen', 'kolapen'), ('nortsib', 'nesibco'), ('nortrus', 'nwrunz'), ('scanmon', 'scambf'), ('taimsib', 'taicens'),
-               ('tranbal', 'trzbald'), ('yamatun', 'yamalgy'), ('kamctun', 'kamtund')]
+# Region list as tuples: (region_code, region_model_code) - defined once in ecoregion_registry.py
+region_pairs = REGION_PAIRS
 
 # Where to save output
 output_dir = '/home/users/clelland/Model/Analysis/Summary stats' # <-- Edit as necessary
 os.makedirs(output_dir, exist_ok=True)
 
-for region, region_model in region_pairs:
-    print(f"Processing {region}...")
-    root = f'/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs/{region}' # <-- Edit as necessary
+# Source file prefixes for each model - every file holds all the variables of its kind
+climate_files = {
+    'Observed': 'e5l_2001_2023',
+    'ACCESS_SSP126': 'access_ssp126_climate_2015_2100',
+    'ACCESS_SSP245': 'access_ssp245_climate_2015_2100',
+    'ACCESS_SSP370': 'access_ssp370_climate_2015_2100',
+    'MRI_SSP126': 'mri_ssp126_climate_2015_2100',
+    'MRI_SSP245': 'mri_ssp245_climate_2015_2100',
+    'MRI_SSP370': 'mri_ssp370_climate_2015_2100',
+}
+fwi_files = {
+    'Observed': 'cems_2001_2023',
+    'ACCESS_SSP126': 'access_ssp126_fwi_2015_2100',
+    'ACCESS_SSP245': 'access_ssp245_fwi_2015_2100',
+    'ACCESS_SSP370': 'access_ssp370_fwi_2015_2100',
+    'MRI_SSP126': 'mri_ssp126_fwi_2015_2100',
+    'MRI_SSP245': 'mri_ssp245_fwi_2015_2100',
+    'MRI_SSP370': 'mri_ssp370_fwi_2015_2100',
+}
+
+# Read from the per-region csv/Parquet files, or from the consolidated Parquet store (build_ecoregion_store.py)
+use_store = False # <-- Edit as necessary
 
-    # Load CSVs
-    csvs = {}
-    for var in all_vars:
-        def read_df(suffix):  # Helper to build file path
-            return pd.read_csv(
-                f'{root}/{suffix}_{region}.csv', parse_dates=['date'], index_col='date' # <-- Edit as necessary
-            )
-
-        if var in climate_vars:
-            csvs[var] = {
-                'Observed': read_df('e5l_2001_2023'),
-                'ACCESS_SSP126': read_df('access_ssp126_climate_2015_2100'),
-                'ACCESS_SSP245': read_df('access_ssp245_climate_2015_2100'),
-                'ACCESS_SSP370': read_df('access_ssp370_climate_2015_2100'),
-                'MRI_SSP126': read_df('mri_ssp126_climate_2015_2100'),
-                'MRI_SSP245': read_df('mri_ssp245_climate_2015_2100'),
-                'MRI_SSP370': read_df('mri_ssp370_climate_2015_2100'),
-            }
-        else:
-            csvs[var] = {
-                'Observed': read_df('cems_2001_2023'),
-                'ACCESS_SSP126': read_df('access_ssp126_fwi_2015_2100'),
-                'ACCESS_SSP245': read_df('access_ssp245_fwi_2015_2100'),
-                'ACCESS_SSP370': read_df('access_ssp370_fwi_2015_2100'),
-                'MRI_SSP126': read_df('mri_ssp126_fwi_2015_2100'),
-                'MRI_SSP245': read_df('mri_ssp245_fwi_2015_2100'),
-                'MRI_SSP370': read_df('mri_ssp370_fwi_2015_2100'),
-            }
-
-    # Output container for plotting
-    results = []
-    raw_means = []
-
-    for var in all_vars:
-        df_all = pd.DataFrame({model: df[var] for model, df in csvs[var].items()})
-        df_all.index = pd.to_datetime(df_all.index)
-        df_all['month'] = df_all.index.month
-
-        # --- Save raw historical mean (2001–2023) before any bias correction ---
-        raw_historical_mask = (df_all.index >= periods['historical'][0]) & (df_all.index <= periods['historical'][1])
-        raw_historical_mean = df_all.loc[raw_historical_mask, 'Observed'].mean()
-
-        # Compute monthly bias correction for SSPs
-        bias_diffs = {}
-        for model in model_groups['ssp']:
-            if model in df_all.columns:
-                period = ('2015-01-01', '2023-12-31')
-                period_mask = (df_all.index >= period[0]) & (df_all.index <= period[1])
-                diff = df_all.loc[period_mask, 'Observed'] - df_all.loc[period_mask, model]
-                bias_diffs[model] = diff.groupby(df_all.loc[period_mask, 'month']).mean()
-
-        # Apply correction
-        corrected = {}
-        corrected['Observed'] = df_all['Observed']
-        for model in df_all.columns.drop(['Observed', 'month']):
-            corrected_series = df_all[model].copy()
-            corrected_series.index = pd.to_datetime(corrected_series.index)
-            corrected_series = corrected_series + df_all['month'].map(bias_diffs[model])
-            corrected[model] = corrected_series
-
-        corrected_df = pd.DataFrame(corrected)
-
-        # Mean values by period
-        means = {}
-        for label, (start, end) in periods.items():
-            mask = (corrected_df.index >= start) & (corrected_df.index <= end)
-            means[label] = corrected_df.loc[mask].mean()
-
-        # Percentage change vs historical
-        historic_mean = raw_historical_mean
-        for future_period in ['2025_2050', '2051_2075', '2076_2100']:
-            delta = ((means[future_period] - historic_mean) / historic_mean) * 100
-            for model in model_groups['ssp']:
-                if model in delta:
-                    results.append({
-                        'region': region,
-                        'variable': var,
-                        'model': model,
-                        'period': future_period,
-                        'percent_change': delta[model]
-                    })
-
-        # Save the raw means for each variable, model, and period
-        for period, mean_series in means.items():
-            for model in mean_series.index:
-                raw_means.append({
-                    'region': region,
-                    'variable': var,
-                    'model': model,
-                    'period': period,
-                    'mean_value': mean_series[model]
-                })
-
-        # Add observed percent_change = 0 for all periods
-        if 'Observed' in means['historical']:
-            results.append({
-                'region': region,
-                'variable': var,
-                'model': 'Observed',
-                'period': 'historical',
-                'percent_change': 0.0
-            })
-        
-    # Save intermediate results
-    df_results = pd.DataFrame(results)
-    df_means = pd.DataFrame(raw_means)
-    
-    # Merge summary stats and raw means
-    df_combined = df_results.merge(df_means, on=['region', 'variable', 'model', 'period'], how='left')
-    df_combined.to_csv(f'{output_dir}/{region}_summary.csv', index=False) # <-- Edit as necessary
\ No newline at end of file
+# Regions are read in parallel and summarised together into master_summary.csv
+n_workers = 8 # <-- Edit as necessary
+write_region_files = False # <-- Edit as necessary - also write {region}_summary.csv
+
+# Only re-read regions whose input files changed since they were cached ('mtime' = size and modification time, 'hash' = contents)
+incremental = True # <-- Edit as necessary
+fingerprint_method = 'mtime' # <-- Edit as necessary
+master_path = f'{output_dir}/master_summary.csv' # <-- Edit as necessary
+
+# Each region's time series are cached here, so other periods, baselines and bias windows don't need the raw files
+cache_dir = f'{output_dir}/Summary cache' # <-- Edit as necessary
+state_path = f'{cache_dir}/inputs.json'
+os.makedirs(cache_dir, exist_ok=True)
+
+# Observations first, then the models - the kernel treats model 0 as the reference for the bias correction
+models = ['Observed'] + model_groups['ssp']
+
+
+def region_paths(region):
+    """Input files of a region: a dict of file prefix -> path, or the region's Parquet store files."""
+    if use_store:
+        from ecoregion_store import STORE_PATH
+        store_root = f'{STORE_PATH}/region={region}'
+        return {os.path.relpath(os.path.join(folder, name), store_root): os.path.join(folder, name)
+                for folder, _, names in sorted(os.walk(store_root)) for name in sorted(names)}
+
+    root = f'/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion CSVs/{region}' # <-- Edit as necessary
+    paths = {}
+    for suffix in list(climate_files.values()) + list(fwi_files.values()):
+        path = f'{root}/{suffix}_{region}' # <-- Edit as necessary
+        # Parquet files from the processing scripts are used if present
+        paths[suffix] = f'{path}.parquet' if os.path.exists(f'{path}.parquet') else f'{path}.csv'
+    return paths
+
+
+def load_region_files(region):
+    """Read each source file of a region once. Returns a dict of file prefix -> DataFrame indexed by date."""
+    suffixes = list(climate_files.values()) + list(fwi_files.values())
+    if use_store:
+        from ecoregion_store import load_region, parse_file_name
+        frames = load_region(region)
+        return {suffix: frames[parse_file_name(f'{suffix}_{region}.parquet')[1:]] for suffix in suffixes}
+
+    def read_df(path):
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_csv(path, parse_dates=['date'], index_col='date')
+
+    return {suffix: read_df(path) for suffix, path in region_paths(region).items()}
+
+
+def cache_region(region):
+    """Read a region's files and cache its (model, variable, time) cube."""
+    region_files = load_region_files(region)
+    # Put the climate and fire weather variables of each model side by side
+    frames = {model: pd.concat([region_files[climate_files[model]][climate_vars],
+                                region_files[fwi_files[model]][fwi_vars]], axis=1) for model in models}
+    cube, dates = build_cube({region: frames}, models, all_vars)
+    save_cube(f'{cache_dir}/{region}.npz', cube[0], dates, models, all_vars)
+
+
+regions = [region for region, region_model in region_pairs]
+settings = {'variables': all_vars, 'models': models, 'use_store': use_store}
+
+# Only read the regions whose input files changed since they were cached
+fingerprints = {region: {name: file_fingerprint(path, fingerprint_method) for name, path in region_paths(region).items()}
+                for region in regions}
+stale = stale_regions(load_fingerprints(state_path), settings, fingerprints) if incremental else regions
+to_cache = [region for region in regions if region in stale or not os.path.exists(f'{cache_dir}/{region}.npz')]
+print(f"Reading {len(to_cache)} of {len(regions)} regions")
+
+executor = None
+if n_workers > 1 and len(to_cache) > 1:
+    # Fork so the workers inherit this script's settings without re-running it
+    executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context('fork'))
+    results = executor.map(cache_region, to_cache)
+else:
+    results = map(cache_region, to_cache)
+
+try:
+    for region, _ in zip(to_cache, results):
+        print(f"Cached {region}")
+finally:
+    if executor is not None:
+        executor.shutdown()
+save_fingerprints(state_path, settings, fingerprints)
+
+# Bias-correct and average every region, variable and model at once from the cache
+cache = SummaryCache.load(cache_dir, regions)
+df_master = cache.summary_table(periods, baseline, bias_window)
+df_master.to_csv(master_path, index=False)
+print(f"Saved {master_path}")
+
+if write_region_files:
+    for region, df_combined in df_master.groupby('region', sort=False):
+        df_combined.to_csv(f'{output_dir}/{region}_summary.csv', index=False) # <-- Edit as necessary
@@ -0,0 +1,134 @@
+"""
+Single registry of the 57 boreal and tundra ecoregions used throughout the analysis: short codes, model codes, groups, RESOLVE names and bounding boxes.
+
+The codes and groups are defined here once instead of being copied into every script and notebook, and the short names follow the same derivation (with the same manual overrides) as the original processing scripts. The names and bounding boxes are cached to a JSON file the first time the registry is built, from the RESOLVE shapefile or from Earth Engine in one request, so the scripts don't need a `getInfo()` per feature.
+"""
+import json
+import os
+from functools import lru_cache
+
+REGISTRY_PATH = '/home/users/clelland/Model/Analysis/RESOLVE shapefile from GEE/ecoregion_registry.json' # <-- Edit as necessary
+SHP_PATH = '/home/users/clelland/Model/Analysis/RESOLVE shapefile from GEE/resolve_shapefile_from_gee.shp' # <-- Edit as necessary
+BIOMES = ['Boreal Forests/Taiga', 'Tundra']
+
+# Manual short name overrides for ecoregions whose derived names clash
+MANUAL_SHORTNAMES = {
+    'Eastern Canadian Shield taiga': 'eashti',
+    'Northeast Siberian taiga': 'nesibta',
+    'Kalaallit Nunaat Arctic steppe': 'kalste'
+}
+
+# (region_code, region_model_code) in the order of the Earth Engine/shapefile selection
+REGION_PAIRS = [('alaspen', 'alapen'), ('centcan', 'cancsh'), ('cookinl', 'cookin'), ('copppla', 'copper'), ('eastcan', 'eastcf'), ('eashti', 'eashti'),
+                ('inteala', 'intlow'), ('mid-bor', 'midbor'), ('midwcan', 'midwes'), ('musklak', 'muslta'), ('nortcan', 'norths'), ('southud', 'sohudb'),
+                ('watshig', 'watson'), ('nortcor', 'norcor'), ('nortter', 'nwterr'), ('eastsib', 'eastsib'), ('icelbor', 'icelnd'), ('kamcmea', 'kamkurm'),
+                ('kamctai', 'kamtaig'), ('nesibta', 'nesibta'), ('okhotai', 'okhman'), ('sakhisl', 'sakhtai'), ('trancon', 'trzconf'), ('westsib', 'westsib'),
+                ('scanand', 'scrusta'), ('uralmon', 'uralfor'), ('ahkland', 'ahklun'), ('berilow', 'berlow'), ('brooran', 'brookr'), ('kalanun', 'kalhar'),
+                ('pacicoa', 'pacice'), ('novoisl', 'novoisl'), ('wranisl', 'wrangel'), ('alaseli', 'aleias'), ('arctcoa', 'arccoa'), ('arctfoo', 'arcfoo'),
+                ('beriupl', 'berupl'), ('canalow', 'canlow'), ('davihig', 'davish'), ('canahig', 'canhig'), ('inteyuk', 'intalp'), ('canamid', 'canmid'),
+                ('ogilalp', 'ogilvi'), ('tornmou', 'tornga'), ('kalste', 'kalste'), ('russarc', 'rusarc'), ('russber', 'rusbert'), ('chermou', 'cherski'),
+                ('chukpen', 'chukchi'), ('kolapen', 'kolapen'), ('nortsib', 'nesibco'), ('nortrus', 'nwrunz'), ('scanmon', 'scambf'), ('taimsib', 'taicens'),
+                ('tranbal', 'trzbald'), ('yamatun', 'yamalgy'), ('kamctun', 'kamtund')]
+
+MODEL_CODES = dict(REGION_PAIRS)
+REGION_CODES = {model_code: code for code, model_code in REGION_PAIRS}
+
+# Region groups: N America boreal, Eurasia boreal and all tundra
+GROUPS = {
+    'nabor': [code for code, _ in REGION_PAIRS[:15]],
+    'eubor': [code for code, _ in REGION_PAIRS[15:26]],
+    'tundra': [code for code, _ in REGION_PAIRS[26:]]
+}
+GROUP_OF = {code: group for group, codes in GROUPS.items() for code in codes}
+
+
+def short_name(eco_name):
+    """Short name of a RESOLVE ecoregion, as used in the output file names."""
+    if eco_name in MANUAL_SHORTNAMES:
+        return MANUAL_SHORTNAMES[eco_name]
+    words = eco_name.split()
+    return (words[0][:4] + words[1][:3]).lower() if len(words) >= 2 else words[0][:7].lower()
+
+
+def region_codes(group=None):
+    """Region codes in selection order, for all regions or one group."""
+    if group is None:
+        return [code for code, _ in REGION_PAIRS]
+    return list(GROUPS[group])
+
+
+def region_pairs(group=None):
+    """(region_code, region_model_code) pairs in selection order, for all regions or one group."""
+    return [(code, MODEL_CODES[code]) for code in region_codes(group)]
+
+
+def build_registry(eco_names, bounds=None, registry_path=REGISTRY_PATH):
+    """
+    Save the registry for the RESOLVE names of the selected ecoregions (in selection order), with optional [west, south, east, north] bounds.
+
+    The derived short names are checked against the codes of REGION_PAIRS as a set (the selection order need not match REGION_PAIRS), so a missing, unknown or duplicated region is caught here rather than in mislabelled output files. Each entry keeps its index in the selection, for looking up its feature.
+    """
+    codes = [short_name(eco_name) for eco_name in eco_names]
+    duplicates = sorted({code for code in codes if codes.count(code) > 1})
+    if duplicates:
+        raise ValueError(f"Derived short names are not unique: {duplicates}")
+    if set(codes) != set(MODEL_CODES):
+        raise ValueError(f"Derived short names do not match REGION_PAIRS: missing {sorted(set(MODEL_CODES) - set(codes))}, "
+                         f"unknown {sorted(set(codes) - set(MODEL_CODES))}")
+
+    entries = []
+    for index, (code, eco_name) in enumerate(zip(codes, eco_names)):
+        entries.append({'region': code, 'model_code': MODEL_CODES[code], 'group': GROUP_OF[code], 'index': index,
+                        'eco_name': eco_name, 'bbox': list(bounds[index]) if bounds is not None else None})
+    with open(registry_path, 'w') as f:
+        json.dump(entries, f, indent=1)
+    load_registry.cache_clear()
+    return load_registry(registry_path)
+
+
+def selected_ecoregions(shp_path=SHP_PATH):
+    """The boreal and tundra ecoregions of the RESOLVE shapefile, in selection order."""
+    import geopandas as gpd
+    gdf = gpd.read_file(shp_path)
+    return gdf[gdf['BIOME_NAME'].isin(BIOMES)].reset_index(drop=True)
+
+
+def build_registry_from_shapefile(shp_path=SHP_PATH, registry_path=REGISTRY_PATH):
+    """Build the registry from the RESOLVE shapefile, with the bounding boxes in EPSG:4326."""
+    selected = selected_ecoregions(shp_path).to_crs(epsg=4326)
+    bounds = [[float(value) for value in bbox] for bbox in selected.geometry.bounds.to_numpy()]
+    return build_registry(list(selected['ECO_NAME']), bounds, registry_path)
+
+
+@lru_cache(maxsize=None)
+def load_registry(registry_path=REGISTRY_PATH):
+    """The cached registry as a dict of region code -> entry (with its selection index), in selection order. Raises FileNotFoundError if it has not been built."""
+    if not os.path.exists(registry_path):
+        raise FileNotFoundError(f"{registry_path} not found - build it with build_registry_from_shapefile() or server_side_extraction.ee_registry()")
+    with open(registry_path) as f:
+        return {entry['region']: entry for entry in json.load(f)}
+
+
+def eco_name(region):
+    """RESOLVE name of a region code."""
+    return load_registry()[region]['eco_name']
+
+
+def bbox(region):
+    """[west, south, east, north] bounds of a region code in EPSG:4326."""
+    return load_registry()[region]['bbox']
+
+
+def region_gdfs(gdf, regions=None):
+    """
+    Dict of region code -> GeoDataFrame of its polygons from a RESOLVE GeoDataFrame, in selection order.
+
+    Every boreal and tundra ecoregion in gdf is included, or only the region codes given.
+    """
+    selected = gdf[gdf['BIOME_NAME'].isin(BIOMES)]
+    gdfs = {}
+    for name in dict.fromkeys(selected['ECO_NAME']):
+        code = short_name(name)
+        if regions is None or code in regions:
+            gdfs[code] = gdf[gdf['ECO_NAME'] == name]
+    return gdfs
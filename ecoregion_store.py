@@ -0,0 +1,189 @@
+"""
+Helpers for a consolidated Parquet store of every per-ecoregion climate and fire weather time series.
+
+The store is one hive-partitioned dataset (region=/source=/model=/scenario=) with a typed `date` column and one column per variable, built from the per-region csv or Parquet files of the processing scripts. The loaders push the region/source/model/scenario and date selections down to the partitions and row groups, and only read the requested variable columns, so the whole dataset loads in seconds instead of thousands of `read_csv` calls.
+"""
+import os
+import re
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+STORE_PATH = '/home/users/clelland/Model/Analysis/CMIP and FWI time series/Ecoregion store' # <-- Edit as necessary
+
+CLIMATE_VARS = ['rh', 'tp', 'rlds', 'rsds', 'wsp', 't2m', 'mx2t', 'mn2t']
+FWI_VARS = ['BUI', 'DC', 'DMC', 'FFMC', 'FWI', 'ISI']
+PARTITIONS = ['region', 'source', 'model', 'scenario']
+
+# Variables of each source, kept as columns by load_region even where they are all missing
+SOURCE_VARIABLES = {'e5l': CLIMATE_VARS, 'cems': FWI_VARS, 'cmip_hist_climate': CLIMATE_VARS, 'cmip_hist_fwi': FWI_VARS,
+                    'cmip_future_climate': CLIMATE_VARS, 'cmip_future_fwi': FWI_VARS}
+
+# File name prefixes of the processing scripts -> (source, model, scenario)
+FILE_PATTERNS = [
+    (re.compile(r'^(e5l)_2001_2023_(?P<region>.+)$'), lambda m: ('e5l', 'observed', 'historical')),
+    (re.compile(r'^(cems)_2001_2023_(?P<region>.+)$'), lambda m: ('cems', 'observed', 'historical')),
+    (re.compile(r'^(?P<model>access|mri)_(?P<kind>climate|fwi)_2001_2014_(?P<region>.+)$'),
+     lambda m: (f"cmip_hist_{m['kind']}", m['model'], 'historical')),
+    (re.compile(r'^(?P<model>access|mri)_(?P<scenario>ssp\d{3})_(?P<kind>climate|fwi)_2015_2100_(?P<region>.+)$'),
+     lambda m: (f"cmip_future_{m['kind']}", m['model'], m['scenario']))
+]
+
+# Columns of the historical CMIP6 climate files (only hurs is renamed there) -> store variables, in the band order of the future files
+COLUMN_ALIASES = {'hurs': 'rh', 'pr': 'tp', 'sfcWind': 'wsp', 'tas': 't2m', 'tasmax': 'mx2t', 'tasmin': 'mn2t'}
+
+SCHEMA = pa.schema([('date', pa.timestamp('ns'))] + [(var, pa.float64()) for var in CLIMATE_VARS + FWI_VARS]
+                   + [(name, pa.string()) for name in PARTITIONS])
+
+
+def parse_file_name(file_name):
+    """(region, source, model, scenario) of a per-region file name, or None if it is not one."""
+    stem, extension = os.path.splitext(file_name)
+    if extension not in ('.csv', '.parquet'):
+        return None
+    for pattern, keys in FILE_PATTERNS:
+        match = pattern.match(stem)
+        if match:
+            return (match['region'],) + keys(match)
+    return None
+
+
+def discover_files(csv_root):
+    """
+    Find every per-region file below csv_root (flat, or in one folder per region). Returns a dict of (region, source, model, scenario) -> path.
+
+    Where both exist, the Parquet file is used rather than the csv file.
+    """
+    files = {}
+    for folder, _, file_names in os.walk(csv_root):
+        for file_name in sorted(file_names):
+            key = parse_file_name(file_name)
+            if key is None:
+                continue
+            path = os.path.join(folder, file_name)
+            if key not in files or path.endswith('.parquet'):
+                files[key] = path
+    return files
+
+
+def read_file(path):
+    """Read one per-region file indexed by date."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=['date'], index_col='date')
+
+
+def to_arrow(df, region, source, model, scenario):
+    """
+    One per-region table as an Arrow table with the store schema (variables it does not have are null).
+
+    Columns are renamed with COLUMN_ALIASES; any other column that is not a store variable raises a ValueError rather than being dropped.
+    """
+    df = df.rename(columns=COLUMN_ALIASES)
+    unknown = [column for column in df.columns if column not in CLIMATE_VARS + FWI_VARS]
+    if unknown:
+        raise ValueError(f"Columns {unknown} of {region} {source} {model} {scenario} are not store variables")
+    df = df.reset_index()
+    df['date'] = pd.to_datetime(df['date'])
+    for var in CLIMATE_VARS + FWI_VARS:
+        if var not in df:
+            df[var] = float('nan')
+    for name, value in zip(PARTITIONS, (region, source, model, scenario)):
+        df[name] = value
+    return pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+
+def build_store(csv_root, store_path=STORE_PATH, regions=None):
+    """
+    Write the per-region files below csv_root into the partitioned store, one region at a time.
+
+    Only the partitions being written are replaced, so a subset of regions can be rebuilt. Returns the keys written.
+    """
+    files = discover_files(csv_root)
+    by_region = {}
+    for key, path in sorted(files.items()):
+        if regions is None or key[0] in regions:
+            by_region.setdefault(key[0], []).append((key, path))
+
+    for region, region_files in by_region.items():
+        print(f"Writing {region} ({len(region_files)} files)")
+        table = pa.concat_tables([to_arrow(read_file(path), *key) for key, path in region_files])
+        ds.write_dataset(table, store_path, format='parquet', partitioning=PARTITIONS, partitioning_flavor='hive',
+                         existing_data_behavior='delete_matching', basename_template='part-{i}.parquet')
+    return [key for region_files in by_region.values() for key, _ in region_files]
+
+
+def open_store(store_path=STORE_PATH):
+    """The store as a pyarrow dataset."""
+    partitioning = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITIONS]), flavor='hive')
+    return ds.dataset(store_path, format='parquet', partitioning=partitioning)
+
+
+def stored_dates(region, source, model, scenario, store_path=STORE_PATH):
+    """Dates already in the store for one series (empty if the store or the series doesn't exist yet)."""
+    if not os.path.isdir(store_path):
+        return pd.DatetimeIndex([])
+    table = open_store(store_path).to_table(columns=['date'], filter=_filter([region], [source], [model], [scenario]))
+    return pd.DatetimeIndex(table.column('date').to_pandas())
+
+
+def append_to_store(df, region, source, model, scenario, store_path=STORE_PATH):
+    """
+    Append the months of one per-region table (indexed by date) that the store doesn't have yet to its partition. Returns the number of months appended.
+
+    The new months are written as an extra file in the partition, so the existing files are never rewritten and monthly updates can be appended as they arrive. Rebuilding the partition with build_store replaces the extra files with the per-region files.
+    """
+    df = df[~df.index.isin(stored_dates(region, source, model, scenario, store_path))].sort_index()
+    if not len(df):
+        return 0
+    first, last = df.index.min(), df.index.max()
+    basename = f"append-{first:%Y%m}-{last:%Y%m}-{time.time_ns()}-{{i}}.parquet"
+    ds.write_dataset(to_arrow(df, region, source, model, scenario), store_path, format='parquet',
+                     partitioning=PARTITIONS, partitioning_flavor='hive',
+                     existing_data_behavior='overwrite_or_ignore', basename_template=basename)
+    return len(df)
+
+
+def _filter(regions=None, sources=None, models=None, scenarios=None, start=None, end=None):
+    """Dataset filter expression for the selections that are given."""
+    expressions = []
+    for name, values in zip(PARTITIONS, (regions, sources, models, scenarios)):
+        if values is not None:
+            expressions.append(ds.field(name).isin(list(values)))
+    if start is not None:
+        expressions.append(ds.field('date') >= pa.scalar(pd.Timestamp(start), pa.timestamp('ns')))
+    if end is not None:
+        expressions.append(ds.field('date') <= pa.scalar(pd.Timestamp(end), pa.timestamp('ns')))
+    if not expressions:
+        return None
+    expression = expressions[0]
+    for other in expressions[1:]:
+        expression = expression & other
+    return expression
+
+
+def load(variables=None, regions=None, sources=None, models=None, scenarios=None, start=None, end=None, store_path=STORE_PATH):
+    """
+    Load a selection of the store as one long DataFrame with columns region, source, model, scenario, date and the variables.
+
+    The region/source/model/scenario selections prune whole partitions, the start/end dates are pushed down to the row groups, and only the variable columns asked for (all if None) are read.
+    """
+    columns = PARTITIONS + ['date'] + list(variables or CLIMATE_VARS + FWI_VARS)
+    table = open_store(store_path).to_table(columns=columns,
+                                            filter=_filter(regions, sources, models, scenarios, start, end))
+    return table.to_pandas()
+
+
+def load_region(region, variables=None, sources=None, store_path=STORE_PATH):
+    """
+    All series of one region as a dict of (source, model, scenario) -> DataFrame indexed by date, like the per-region files.
+
+    Each series has the columns of its source's variables (of those requested), like the per-region files, even where a variable is all missing.
+    """
+    df = load(variables, regions=[region], sources=sources, store_path=store_path)
+    frames = {}
+    for (source, model, scenario), group in df.groupby(['source', 'model', 'scenario'], sort=False, observed=True):
+        columns = [var for var in SOURCE_VARIABLES[source] if variables is None or var in variables]
+        frames[(source, model, scenario)] = group.set_index('date').sort_index().reindex(columns=columns)
+    return frames
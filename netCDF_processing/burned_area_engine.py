@@ -0,0 +1,223 @@
+"""
+Single-pass engine to find the monthly burned area for many regions from the annual prediction netCDF files.
+
+The loop order is file -> all regions: each `predictions` array is streamed once in blocks aligned to the on-disk chunking, so every zlib chunk is only inflated once, and the monthly burned area for every region is appended to its csv file as each year is finished. The (model, scenario, year) files can be spread across a pool of worker processes on one node.
+"""
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xarray as xr
+from region_labels import load_label_raster, burned_pixels_by_label, burned_pixels_by_label_sweep
+from region_weights import load_weights, block_weights, burned_area_weighted, burned_area_weighted_sweep
+
+# Each pixel = 4000m x 4000m = 16 km²
+PIXEL_AREA_MHA = 16 / 10000
+
+# Per-process state for the worker pool
+_worker_state = {}
+
+
+def time_block_size(da):
+    """Number of timesteps per on-disk chunk, so a block read inflates each chunk exactly once."""
+    chunksizes = da.encoding.get('chunksizes')
+    if chunksizes:
+        return int(chunksizes[da.dims.index('time')])
+    return da.sizes['time']
+
+
+def disk_chunks(path, time_multiple=1):
+    """Dask chunks for the predictions aligned to the on-disk zlib chunking, optionally grouping several time chunks."""
+    with xr.open_dataset(path) as ds:
+        da = ds['predictions']
+        chunksizes = da.encoding.get('chunksizes') or da.shape
+        chunks = {dim: int(size) for dim, size in zip(da.dims, chunksizes)}
+    chunks['time'] *= time_multiple
+    return chunks
+
+
+def is_zarr(path):
+    """True for a consolidated Zarr store rather than a netCDF file."""
+    return path.rstrip('/').endswith('.zarr')
+
+
+def open_predictions(path, chunks=None, scenario=None, year=None):
+    """
+    Open a prediction netCDF file, eagerly (chunks=None) or lazily with dask, or one scenario/year of a consolidated Zarr store.
+
+    chunks='disk' uses the on-disk chunking; a dict of time/lat/lon sizes is passed straight to xarray. Zarr stores are always lazy with their own chunking.
+    """
+    if is_zarr(path):
+        ds = xr.open_zarr(path, consolidated=True)
+        if scenario is not None:
+            ds = ds.sel(scenario=scenario)
+        if year is not None:
+            ds = ds.sel(time=str(year))
+        return ds
+    if chunks == 'disk':
+        chunks = disk_chunks(path)
+    return xr.open_dataset(path, chunks=chunks)
+
+
+def _slices(chunk_sizes):
+    start = 0
+    for size in chunk_sizes:
+        yield slice(start, start + size)
+        start += size
+
+
+def iter_blocks(da, time_block):
+    """Yield (time, lat, lon) slices covering a (time, lat, lon) array one block at a time."""
+    if da.chunks is not None:
+        time_chunks, lat_chunks, lon_chunks = da.chunks
+    else:
+        n_times = da.sizes['time']
+        time_chunks = [min(time_block, n_times - start) for start in range(0, n_times, time_block)]
+        lat_chunks, lon_chunks = [da.sizes['lat']], [da.sizes['lon']]
+
+    for t in _slices(time_chunks):
+        for y in _slices(lat_chunks):
+            for x in _slices(lon_chunks):
+                yield t, y, x
+
+
+def read_grid(path):
+    """Return the lat/lon coordinates of a prediction file."""
+    with open_predictions(path) as ds:
+        return ds['lat'].values, ds['lon'].values
+
+
+def is_sweep(threshold):
+    """True when a list of thresholds is given rather than a single probability cut-off."""
+    return np.ndim(threshold) > 0
+
+
+def area_columns(threshold):
+    """Burned area column name(s) for a single threshold or a sweep."""
+    if is_sweep(threshold):
+        return [f'burned_area_Mha_{value:g}' for value in threshold]
+    return ['burned_area_Mha']
+
+
+def reduce_block(values, y, x, state):
+    """Burned pixel counts (label raster) or burned area in Mha (coverage weights) for one (time, lat, lon) block."""
+    sweep = is_sweep(state['threshold'])
+    if state['weights'] is not None:
+        weights = state['weights']
+        if (y.stop - y.start, x.stop - x.start) != state['grid_shape']:
+            key = (y.start, y.stop, x.start, x.stop)
+            if key not in state['block_weights']:
+                state['block_weights'][key] = block_weights(weights, y, x, state['grid_shape'][1])
+            weights = state['block_weights'][key]
+        kernel = burned_area_weighted_sweep if sweep else burned_area_weighted
+        return kernel(values, weights, state['n_regions'], state['threshold'])
+
+    kernel = burned_pixels_by_label_sweep if sweep else burned_pixels_by_label
+    return kernel(values, state['labels'][y, x], state['n_regions'], state['threshold'])
+
+
+def process_file(path, state, scenario=None, year=None):
+    """
+    Stream the predictions of one file once and return (times, burned area in Mha per region).
+
+    state holds the label raster (whole 16 km² pixels) or the coverage weights (exact area), n_regions, threshold, chunks and pixel_area_mha. A list of thresholds gives areas of shape (time, region, threshold) from the same single read. With chunks set the file is opened lazily and reduced one dask chunk at a time, so memory stays bounded by the chunk size and the combined 2025-2100 files can be processed directly.
+    """
+    weighted = state['weights'] is not None
+    with open_predictions(path, state['chunks'], scenario, year) as ds:
+        da = ds['predictions']
+        block = time_block_size(da)
+        da = da.transpose('time', 'lat', 'lon')
+
+        shape = (da.sizes['time'], state['n_regions'])
+        if is_sweep(state['threshold']):
+            shape += (len(state['threshold']),)
+        total = np.zeros(shape, dtype=np.float64 if weighted else np.int32)
+        for t, y, x in iter_blocks(da, block):
+            values = da.isel(time=t, lat=y, lon=x).values
+            total[t] += reduce_block(values, y, x, state)
+        times = ds['time'].values
+
+    if weighted:
+        return times, total
+    return times, total * state['pixel_area_mha']
+
+
+def _init_worker(state):
+    """Keep the label raster or weights in each worker so they are only sent once per process."""
+    _worker_state.update(state)
+
+
+def _process_unit(task):
+    path, *selection = task
+    return process_file(path, _worker_state, *selection)
+
+
+def run_all(path_template, models, scenarios, years, region_gdfs, label_cache_path, output_template,
+            threshold=0.5, pixel_area_mha=PIXEL_AREA_MHA, n_workers=1, chunks=None,
+            area_weighting='pixel', weight_cache_path=None):
+    """
+    Process every model/scenario/year file, reading each once for all regions, optionally across a pool of worker processes.
+
+    path_template is formatted with model, scenario and year; output_template with name, model and scenario. If path_template has no {year} field it is treated as a combined 2025-2100 file per model/scenario, best opened lazily with chunks (see open_predictions). A path_template ending in .zarr is a consolidated store per model (from convert_netCDF_to_zarr.py), read one scenario/year at a time. The units are spread over n_workers processes and the results merged back in the original time order, so each region's csv is written year by year with columns time, burned_area_Mha. If threshold is a list (a sweep) every threshold is found from the same read and the csv has one burned_area_Mha_{threshold} column per threshold.
+
+    area_weighting='pixel' counts whole pixels of pixel_area_mha inside each region (as rio.clip), while 'exact' uses cached weights of true cell area x polygon coverage fraction from weight_cache_path. Returns a dict of (model, scenario) -> {region name: burned area Series (DataFrame for a sweep) indexed by time}.
+    """
+    names = list(region_gdfs)
+    columns = area_columns(threshold)
+    zarr_input = is_zarr(path_template)
+    if '{year}' not in path_template and not zarr_input:
+        years = [None]
+    units = [(model, scenario, year) for model in models for scenario in scenarios for year in years]
+    paths = [path_template.format(model=model, scenario=scenario, year=year) for model, scenario, year in units]
+
+    # Zarr stores hold every scenario and year, so each task selects its own
+    if zarr_input:
+        tasks = [(path, scenario, year) for path, (_, scenario, year) in zip(paths, units)]
+    else:
+        tasks = [(path,) for path in paths]
+
+    lat, lon = read_grid(paths[0])
+    state = {'labels': None, 'weights': None, 'block_weights': {}, 'grid_shape': (len(lat), len(lon)),
+             'n_regions': len(names), 'threshold': threshold, 'chunks': chunks, 'pixel_area_mha': pixel_area_mha}
+    if area_weighting == 'exact':
+        state['weights'] = load_weights(weight_cache_path, region_gdfs, lat, lon)
+    else:
+        state['labels'] = load_label_raster(label_cache_path, region_gdfs, lat, lon)
+
+    executor = None
+    if n_workers > 1:
+        # Fork so the workers inherit the imported modules without re-running the calling script
+        executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context('fork'),
+                                       initializer=_init_worker, initargs=(state,))
+        results = executor.map(_process_unit, tasks)
+    else:
+        _init_worker(state)
+        results = map(_process_unit, tasks)
+
+    frames = {}
+    try:
+        # Results come back in submission order, so each run is appended in time order
+        for (model, scenario, year), (times, area) in zip(units, results):
+            print(f"Processed: {model} {scenario} {year or 'all years'}")
+            first = (model, scenario) not in frames
+            run_frames = frames.setdefault((model, scenario), {name: [] for name in names})
+
+            # Append this year to every region's csv
+            for j, name in enumerate(names):
+                area_df = pd.DataFrame(area[:, j].reshape(len(times), -1), columns=columns)
+                area_df.insert(0, 'time', times)
+                output_csv_path = output_template.format(name=name, model=model, scenario=scenario)
+                area_df.to_csv(output_csv_path, mode='w' if first else 'a', header=first, index=False)
+                run_frames[name].append(area_df)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    all_series = {}
+    for (model, scenario), run_frames in frames.items():
+        for name in names:
+            print(f"Saved area time series to {output_template.format(name=name, model=model, scenario=scenario)}")
+        all_series[(model, scenario)] = {name: pd.concat(run_frames[name]).set_index('time')[columns if is_sweep(threshold) else columns[0]]
+                                         for name in names}
+    return all_series
+
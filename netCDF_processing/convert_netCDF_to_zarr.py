@@ -0,0 +1,38 @@
+"""
+Script to convert the combined 2025-2100 output netCDF files into a single consolidated Zarr store per model, with dimensions scenario/time/lat/lon.
+
+The store replaces the split yearly files: the time-series scripts read it directly by setting `netcdf_template` to the store path, and parallel reads from one chunked store scale far better on Lustre than opening many small files.
+"""
+import xarray as xr
+from zarr.codecs import BloscCodec, BloscShuffle
+from burned_area_engine import open_predictions
+
+models = ['access', 'mri']
+scenarios = ['ssp126', 'ssp245', 'ssp370']
+
+# Input files and output store - {model} is filled in for each store
+input_template = '/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_north/output_{model}_north_{scenario}_2025_2100_v2.nc' # <-- Edit as necessary
+store_template = '/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_north/predictions_{model}_north.zarr' # <-- Edit as necessary
+
+# One scenario and year per chunk, tiled in lat/lon, so a region-wise time series only touches the tiles under the region
+chunk_shape = {'scenario': 1, 'time': 12, 'lat': 256, 'lon': 256} # <-- Edit as necessary
+compressor = BloscCodec(cname='zstd', clevel=5, shuffle=BloscShuffle.shuffle) # <-- Edit as necessary
+
+for model in models:
+    # Stack the scenarios lazily along a new dimension
+    datasets = [open_predictions(input_template.format(model=model, scenario=scenario), chunks='disk') for scenario in scenarios]
+    ds = xr.concat(datasets, dim=xr.DataArray(scenarios, dims='scenario', name='scenario'))
+    ds = ds.transpose('scenario', 'time', 'lat', 'lon', ...)
+    ds = ds.chunk({dim: min(size, ds.sizes[dim]) for dim, size in chunk_shape.items()})
+
+    # Drop the netCDF encodings so the zarr chunks and compressor are used
+    for var in ds.variables.values():
+        var.encoding = {}
+
+    store_path = store_template.format(model=model)
+    encoding = {'predictions': {'compressors': (compressor,), 'chunks': tuple(ds.chunks[dim][0] for dim in ds['predictions'].dims)}}
+    ds.to_zarr(store_path, mode='w', encoding=encoding, consolidated=True, zarr_format=3)
+    print(f"Saved Zarr store for {model}: {store_path}")
+
+    for dataset in datasets:
+        dataset.close()
@@ -4,111 +4,76 @@ Script to find the total burned area from processed annual netCDF files for each
 All ecoregions across the ABZ are processed here, although the code can easily be adapted to focus on certain areas.
 """
 import matplotlib.pyplot as plt
-import xarray as xr
 import geopandas as gpd
 import warnings
 import os
+import sys
 import time
+from burned_area_engine import run_all, is_sweep
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ecoregion_registry import SHP_PATH, region_gdfs
 warnings.filterwarnings("ignore")
 
 start_time = time.time()
 os.environ["CPL_LOG"] = "/home/users/clelland/Model/error_files/Processing/ERROR7"
 
 # Load shapefile
-shp_path = '/home/users/clelland/Model/Analysis/RESOLVE shapefile from GEE/resolve_shapefile_from_gee.shp'
+shp_path = SHP_PATH # <-- Edit as necessary
 gdf = gpd.read_file(shp_path)
-selected_ecoregions = gdf[gdf['BIOME_NAME'].isin(['Boreal Forests/Taiga', 'Tundra'])]
 print("Shapefile loaded")
 
-# Set manual overrides for certain regions
-manual_shortnames = {
-    'Eastern Canadian Shield taiga': 'eashti',
-    'Northeast Siberian taiga': 'nesibta',
-    'Kalaallit Nunaat Arctic steppe': 'kalste'
-}
-
-# Loop through filtered ecoregions and create short names
-regions = {}
-for _, row in selected_ecoregions.iterrows():
-    eco_name = row['ECO_NAME']
-    
-    # Use manual shortname if available
-    if eco_name in manual_shortnames:
-        short_name = manual_shortnames[eco_name]
-    else:
-        words = eco_name.split()
-        short_name = (words[0][:4] + words[1][:3]).lower() if len(words) >= 2 else words[0][:7].lower()
-
-    print(f"Processing region: {eco_name} -> {short_name}")
-
-    # Store the individual GeoDataFrame in the dictionary
-    regions[short_name] = gdf[gdf['ECO_NAME'] == eco_name]
+# One GeoDataFrame per region, named by the shared region registry (ecoregion_registry.py)
+regions = region_gdfs(gdf)
+for short_name, region_gdf in regions.items():
+    print(f"Processing region: {region_gdf['ECO_NAME'].iloc[0]} -> {short_name}")
 
 years = range(2025, 2101)
 models = ['access', 'mri']
 scenarios = ['ssp126', 'ssp245', 'ssp370']
 
-# Loop through regions, models, scenarios, years
-for short_name, region_gdf in regions.items():
-    print(f"Processing region: {short_name}")
-    
-    # Initialize an empty list to collect area time series
-    for model in models:
-        for scenario in scenarios:
-            area_list = []
-            for year in years:
-                print(f"Iterating over: {model} {scenario} {year} for {short_name}")
-                netcdf_path = f"/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_north/{scenario}/output_{model}_north_{scenario}_{year}_v2.nc" # <-- Edit as necessary
-                ds = xr.open_dataset(netcdf_path)
-                ds.rio.set_spatial_dims(x_dim="lon", y_dim="lat", inplace=True)
-                ds.rio.write_crs("EPSG:4326", inplace=True)
-                ds_clip = ds.rio.clip(region_gdf.geometry.values, region_gdf.crs, drop=True)
-                ds_subset = ds_clip.where(ds_clip["predictions"] >= 0.5) # <-- Edit prediction probability as necessary
-                ds_subset = ds_subset.dropna(dim="time", how="all")
-                ds_subset = ds_subset.dropna(dim="lat", how="all")
-                ds_subset = ds_subset.dropna(dim="lon", how="all")
-                
-                # Load NetCDF file with rioxarray
-                da = ds_subset["predictions"]
-                
-                # Compute area per timestep
-                # Each pixel = 4000m x 4000m = 16 km²
-                pixel_area_mha = 16 / 10000
-                
-                # Area over time
-                masked_area = (da > 0).sum(dim=["lat", "lon"]) * pixel_area_mha
-                full_times = ds["time"]
-                area_timeseries_year = masked_area.reindex(time=full_times, fill_value=0)
-            
-                area_list.append(area_timeseries_year)
-                ds.close()
-            
-            # Concatenate all years along the time dimension
-            area_timeseries = xr.concat(area_list, dim="time")
-            
-            # Convert to pandas Series
-            area_series = area_timeseries.to_series()
-            
-            # Reset index to get a DataFrame with columns: time, value
-            area_df = area_series.reset_index()
-            area_df.columns = ['time', 'burned_area_Mha']
-            
-            # Save to CSV
-            output_csv_path = f"/home/users/clelland/Model/Analysis/Ecoregion plots/area_timeseries_eco_{short_name}_{model}_{scenario}.csv" # <-- Edit as necessary
-            area_df.to_csv(output_csv_path, index=False)
-            
-            print(f"Saved area time series to {output_csv_path}")
-            
-            time_values = area_timeseries["time"].values
-            plt.figure(figsize=(12, 5))
-            plt.plot(time_values, area_timeseries.values, label=f"Burned Area (Mha for {short_name}")
-            plt.xlabel("Time")
-            plt.ylabel("Burned Area (Mha)")
-            plt.title(f"Burned Area Over Time for {short_name}, {model} {scenario}")
-            plt.grid(True)
-            plt.legend()
-            plt.tight_layout()
-            plt.savefig(f'/home/users/clelland/Model/Analysis/Ecoregion plots/area_timeseries_{model}_{scenario}_eco_{short_name}.png', dpi=300, bbox_inches='tight', transparent=True) # <-- Edit as necessary
+# Region label raster on the prediction grid, rasterised once and cached
+label_cache_path = '/home/users/clelland/Model/Analysis/RESOLVE shapefile from GEE/resolve_labels_4km.npz' # <-- Edit as necessary
+
+# Area weighting: 'pixel' counts whole 16 km² pixels with their centre in each region (as rio.clip), 'exact' weights each cell by its true area x polygon coverage fraction
+area_weighting = 'pixel' # <-- Edit as necessary
+weight_cache_path = '/home/users/clelland/Model/Analysis/RESOLVE shapefile from GEE/resolve_weights_4km.npz' # <-- Edit as necessary
+
+# Input and output path templates, filled in by the engine - drop {year} to read the combined 2025-2100 file, or give a
+# consolidated Zarr store per model from convert_netCDF_to_zarr.py, e.g. ".../output_{model}_north/predictions_{model}_north.zarr"
+netcdf_template = "/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_north/{scenario}/output_{model}_north_{scenario}_{year}_v2.nc" # <-- Edit as necessary
+output_csv_template = "/home/users/clelland/Model/Analysis/Ecoregion plots/area_timeseries_eco_{name}_{model}_{scenario}.csv" # <-- Edit as necessary
+
+# Prediction probability threshold, or a list of thresholds to sweep from one read of each file
+threshold = 0.5 # <-- Edit prediction probability as necessary, e.g. [0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+if is_sweep(threshold):
+    # One csv per region with a burned_area_Mha_{threshold} column per threshold
+    output_csv_template = output_csv_template.replace('.csv', '_sweep.csv')
+
+# Lazy loading: None reads each file eagerly, 'disk' (or a dict of time/lat/lon sizes) reads it one dask chunk at a time with bounded memory
+chunks = None # <-- Edit as necessary, e.g. 'disk' for the combined 2025-2100 files
+
+# Number of worker processes, 1 runs serially
+n_workers = int(os.environ.get("SLURM_CPUS_PER_TASK", 1)) # <-- Edit as necessary
+
+# Process all model/scenario/year files in parallel - each annual file is read once for all regions
+all_series = run_all(netcdf_template, models, scenarios, years, regions, label_cache_path, output_csv_template,
+                     threshold=threshold, n_workers=n_workers, chunks=chunks,
+                     area_weighting=area_weighting, weight_cache_path=weight_cache_path)
+
+for (model, scenario), area_series in all_series.items():
+    if is_sweep(threshold):
+        continue  # Sweeps are for the sensitivity csv files only
+    for short_name, area_timeseries in area_series.items():
+        plt.figure(figsize=(12, 5))
+        plt.plot(area_timeseries.index, area_timeseries.values, label=f"Burned Area (Mha for {short_name}")
+        plt.xlabel("Time")
+        plt.ylabel("Burned Area (Mha)")
+        plt.title(f"Burned Area Over Time for {short_name}, {model} {scenario}")
+        plt.grid(True)
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(f'/home/users/clelland/Model/Analysis/Ecoregion plots/area_timeseries_{model}_{scenario}_eco_{short_name}.png', dpi=300, bbox_inches='tight', transparent=True) # <-- Edit as necessary
+        plt.close()
 
 # Record time
 end_time = time.time()
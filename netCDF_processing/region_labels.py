@@ -0,0 +1,147 @@
+"""
+Helpers to rasterise region shapefiles onto the 4 km lat/lon prediction grid as a single integer label array, so that burned area can be found for every region from one read of each annual netCDF file. The thresholded pixel counts are done with reused buffers rather than NaN-masked copies of the cube.
+
+The label array is cached to disk, so the rasterisation is only done once per shapefile and grid. Label 0 is outside all regions and label i + 1 belongs to the i-th region name.
+"""
+import os
+import numpy as np
+from rasterio import features
+from rasterio.transform import from_origin
+
+
+def grid_transform(lat, lon):
+    """Return the north-up affine transform for cell-centre lat/lon coordinates."""
+    dx = abs(float(lon[1] - lon[0]))
+    dy = abs(float(lat[1] - lat[0]))
+    west = float(lon.min()) - dx / 2
+    north = float(lat.max()) + dy / 2
+    return from_origin(west, north, dx, dy)
+
+
+def rasterise_regions(region_gdfs, lat, lon):
+    """
+    Burn each region onto the lat/lon grid, matching the pixel selection of `rio.clip` (pixel centre inside polygon).
+
+    region_gdfs is a dict of name -> GeoDataFrame; all polygons of one entry share the same label.
+    """
+    shapes = []
+    for label, region_gdf in enumerate(region_gdfs.values(), start=1):
+        region_gdf = region_gdf.to_crs(epsg=4326)
+        shapes.extend((geom, label) for geom in region_gdf.geometry.values if geom is not None and not geom.is_empty)
+
+    labels = features.rasterize(shapes, out_shape=(len(lat), len(lon)), transform=grid_transform(lat, lon),
+                                fill=0, all_touched=False, dtype='int32')
+
+    # Rasterio works north-up, so flip back if the latitudes are ascending
+    if lat[0] < lat[-1]:
+        labels = labels[::-1, :]
+    return np.ascontiguousarray(labels)
+
+
+def load_cached(cache_path, region_gdfs, lat, lon, build, description):
+    """
+    Load cached arrays for a region list and grid, or build them with build(region_gdfs, lat, lon) and cache them.
+
+    The cache is rebuilt if it was made for a different grid or region list.
+    """
+    names = np.array(list(region_gdfs))
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if (np.array_equal(cached['lat'], lat) and np.array_equal(cached['lon'], lon)
+                and np.array_equal(cached['names'], names)):
+            print(f"Loaded {description} from {cache_path}")
+            return {key: cached[key] for key in cached.files if key not in ('lat', 'lon', 'names')}
+        print(f"{description.capitalize()} at {cache_path} does not match the grid or regions, rebuilding")
+
+    arrays = build(region_gdfs, lat, lon)
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    np.savez_compressed(cache_path, lat=lat, lon=lon, names=names, **arrays)
+    print(f"Saved {description} to {cache_path}")
+    return arrays
+
+
+def load_label_raster(cache_path, region_gdfs, lat, lon):
+    """Load the cached label raster, or rasterise and cache it if missing or built for a different grid/region list."""
+    build = lambda gdfs, lat, lon: {'labels': rasterise_regions(gdfs, lat, lon)}
+    return load_cached(cache_path, region_gdfs, lat, lon, build, 'label raster')['labels']
+
+
+def burned_mask(values, threshold, out):
+    """
+    Flag burned pixels in place, matching the old `where(predictions >= threshold)` then `> 0` selection.
+
+    NaN compares False, and the smallest positive value of the array dtype as a floor keeps the `> 0` condition for thresholds <= 0.
+    """
+    smallest = np.nextafter(values.dtype.type(0), values.dtype.type(1))
+    return np.greater_equal(values, max(threshold, smallest), out=out)
+
+
+def burned_pixels_by_label(predictions, labels, n_regions, threshold=0.5):
+    """
+    Count the pixels with prediction >= threshold for every timestep and every region in one pass.
+
+    predictions is a (time, lat, lon) array and labels the (lat, lon) label raster. Returns an int32 (time, n_regions) array where column i is label i + 1.
+    """
+    n_times = predictions.shape[0]
+    flat = predictions.reshape(n_times, -1)
+    flat_labels = labels.ravel()
+
+    # Only pixels that fall inside a region are thresholded
+    pixel_idx = np.flatnonzero(flat_labels)
+    region_idx = flat_labels[pixel_idx] - 1
+
+    # Buffers reused for every timestep
+    values = np.empty(pixel_idx.size, dtype=flat.dtype)
+    burned = np.empty(pixel_idx.size, dtype=bool)
+    counts = np.empty((n_times, n_regions), dtype=np.int32)
+    for t in range(n_times):
+        np.take(flat[t], pixel_idx, out=values, mode='clip')
+        counts[t] = np.bincount(region_idx[burned_mask(values, threshold, burned)], minlength=n_regions)
+    return counts
+
+
+def sweep_cutoffs(thresholds, dtype):
+    """Sort the thresholds, with the same > 0 floor as burned_mask. Returns (order, sorted cutoffs)."""
+    order = np.argsort(thresholds)
+    smallest = np.nextafter(dtype.type(0), dtype.type(1))
+    return order, np.maximum(np.asarray(thresholds, dtype=dtype)[order], smallest)
+
+
+def threshold_bins(values, cutoffs, missing):
+    """Number of sorted cutoffs each value reaches, with NaN (which sorts last) never counted as burned."""
+    bins = np.searchsorted(cutoffs, values, side='right')
+    bins[np.isnan(values, out=missing)] = 0
+    return bins
+
+
+def at_or_above(hist):
+    """Turn per-region bin histograms into counts at or above each sorted threshold with a reverse cumulative sum."""
+    return np.cumsum(hist[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+
+def burned_pixels_by_label_sweep(predictions, labels, n_regions, thresholds):
+    """
+    Count burned pixels for several probability thresholds at once from a single pass over the predictions.
+
+    Each pixel is binned by how many of the sorted thresholds it reaches, the bins are counted per region with one bincount, and a reverse cumulative sum gives the count at or above every threshold. Returns an int32 (time, n_regions, n_thresholds) array in the order the thresholds were given.
+    """
+    n_times = predictions.shape[0]
+    flat = predictions.reshape(n_times, -1)
+    flat_labels = labels.ravel()
+    order, cutoffs = sweep_cutoffs(thresholds, flat.dtype)
+    n_bins = len(cutoffs) + 1
+
+    # Only pixels that fall inside a region are binned
+    pixel_idx = np.flatnonzero(flat_labels)
+    offsets = (flat_labels[pixel_idx] - 1) * n_bins
+
+    # Buffers reused for every timestep
+    values = np.empty(pixel_idx.size, dtype=flat.dtype)
+    missing = np.empty(pixel_idx.size, dtype=bool)
+    counts = np.empty((n_times, n_regions, len(cutoffs)), dtype=np.int32)
+    for t in range(n_times):
+        np.take(flat[t], pixel_idx, out=values, mode='clip')
+        bins = threshold_bins(values, cutoffs, missing)
+        hist = np.bincount(offsets + bins, minlength=n_regions * n_bins).reshape(n_regions, n_bins)
+        counts[t][:, order] = at_or_above(hist)
+    return counts
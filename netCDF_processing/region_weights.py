@@ -0,0 +1,118 @@
+"""
+Helpers to build a sparse weight raster for each region on the 4 km lat/lon prediction grid: the true (latitude-dependent) area of each cell multiplied by the fraction of the cell covered by the region polygons.
+
+Counting whole pixels treats every cell as 16 km² and includes or excludes it by its centre, which gives a large boundary error for small ecoregions such as wranisl and novoisl. The weights are cached per shapefile and grid, and burned area is then a sparse weighted sum over the covered cells.
+"""
+import numpy as np
+import shapely
+from rasterio import features
+from region_labels import grid_transform, load_cached, burned_mask, sweep_cutoffs, threshold_bins, at_or_above
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def cell_area_mha(lat, lon):
+    """True area of each grid cell in Mha as a (lat, lon) array, from the spherical band between the cell edges."""
+    dlat = abs(float(lat[1] - lat[0]))
+    dlon = abs(float(lon[1] - lon[0]))
+    south = np.radians(np.clip(lat - dlat / 2, -90, 90))
+    north = np.radians(np.clip(lat + dlat / 2, -90, 90))
+    area_km2 = EARTH_RADIUS_KM ** 2 * np.radians(dlon) * np.abs(np.sin(north) - np.sin(south))
+    return np.broadcast_to((area_km2 / 10000)[:, None], (len(lat), len(lon)))
+
+
+def coverage_fractions(geom, lat, lon, batch_size=100000):
+    """
+    Exact fraction of each grid cell covered by geom. Returns (flat cell indices, fractions) for the covered cells.
+
+    Only cells touched by the polygon are tested; cells wholly inside are 1 and only the boundary cells need an intersection.
+    """
+    touched = features.rasterize([(geom, 1)], out_shape=(len(lat), len(lon)), transform=grid_transform(lat, lon),
+                                 fill=0, all_touched=True, dtype='uint8')
+    if lat[0] < lat[-1]:
+        touched = touched[::-1, :]
+    rows, cols = np.nonzero(touched)
+
+    dlat = abs(float(lat[1] - lat[0]))
+    dlon = abs(float(lon[1] - lon[0]))
+    shapely.prepare(geom)
+    fractions = np.ones(rows.size)
+    for start in range(0, rows.size, batch_size):
+        r = rows[start:start + batch_size]
+        c = cols[start:start + batch_size]
+        cells = shapely.box(lon[c] - dlon / 2, lat[r] - dlat / 2, lon[c] + dlon / 2, lat[r] + dlat / 2)
+        partial = ~shapely.contains(geom, cells)
+        fractions[start:start + batch_size][partial] = shapely.area(shapely.intersection(cells[partial], geom)) / (dlat * dlon)
+
+    covered = fractions > 0
+    return (rows * len(lon) + cols)[covered], fractions[covered]
+
+
+def build_weights(region_gdfs, lat, lon):
+    """Sparse (pixel_idx, region_idx, weight) arrays, where weight is the covered area of the cell in Mha."""
+    area = cell_area_mha(lat, lon).ravel()
+    pixel_idx, region_idx, weight = [], [], []
+    for i, (name, region_gdf) in enumerate(region_gdfs.items()):
+        print(f"Finding coverage weights for {name}")
+        geom = shapely.union_all(region_gdf.to_crs(epsg=4326).geometry.values)
+        idx, fractions = coverage_fractions(geom, lat, lon)
+        pixel_idx.append(idx)
+        region_idx.append(np.full(idx.size, i, dtype=np.int32))
+        weight.append(fractions * area[idx])
+    return {'pixel_idx': np.concatenate(pixel_idx), 'region_idx': np.concatenate(region_idx),
+            'weight': np.concatenate(weight)}
+
+
+def load_weights(cache_path, region_gdfs, lat, lon):
+    """Load the cached weights, or build and cache them if missing or built for a different grid/region list."""
+    return load_cached(cache_path, region_gdfs, lat, lon, build_weights, 'coverage weights')
+
+
+def block_weights(weights, y, x, n_lon):
+    """Weights for the (lat, lon) block given by slices y and x, with pixel indices local to the block."""
+    rows, cols = np.divmod(weights['pixel_idx'], n_lon)
+    inside = (rows >= y.start) & (rows < y.stop) & (cols >= x.start) & (cols < x.stop)
+    local_idx = (rows[inside] - y.start) * (x.stop - x.start) + (cols[inside] - x.start)
+    return {'pixel_idx': local_idx, 'region_idx': weights['region_idx'][inside], 'weight': weights['weight'][inside]}
+
+
+def burned_area_weighted(predictions, weights, n_regions, threshold=0.5):
+    """
+    Burned area in Mha for every timestep and region as a weighted sum of the covered cells with prediction >= threshold.
+
+    Returns a float64 (time, n_regions) array.
+    """
+    n_times = predictions.shape[0]
+    flat = predictions.reshape(n_times, -1)
+    pixel_idx, region_idx, weight = weights['pixel_idx'], weights['region_idx'], weights['weight']
+
+    # Buffers reused for every timestep
+    values = np.empty(pixel_idx.size, dtype=flat.dtype)
+    burned = np.empty(pixel_idx.size, dtype=bool)
+    area = np.empty((n_times, n_regions))
+    for t in range(n_times):
+        np.take(flat[t], pixel_idx, out=values, mode='clip')
+        burned_mask(values, threshold, burned)
+        area[t] = np.bincount(region_idx[burned], weights=weight[burned], minlength=n_regions)
+    return area
+
+
+def burned_area_weighted_sweep(predictions, weights, n_regions, thresholds):
+    """Weighted burned area for several thresholds from one pass. Returns a float64 (time, n_regions, n_thresholds) array."""
+    n_times = predictions.shape[0]
+    flat = predictions.reshape(n_times, -1)
+    pixel_idx, weight = weights['pixel_idx'], weights['weight']
+    order, cutoffs = sweep_cutoffs(thresholds, flat.dtype)
+    n_bins = len(cutoffs) + 1
+    offsets = weights['region_idx'] * n_bins
+
+    # Buffers reused for every timestep
+    values = np.empty(pixel_idx.size, dtype=flat.dtype)
+    missing = np.empty(pixel_idx.size, dtype=bool)
+    area = np.empty((n_times, n_regions, len(cutoffs)))
+    for t in range(n_times):
+        np.take(flat[t], pixel_idx, out=values, mode='clip')
+        bins = threshold_bins(values, cutoffs, missing)
+        hist = np.bincount(offsets + bins, weights=weight, minlength=n_regions * n_bins).reshape(n_regions, n_bins)
+        area[t][:, order] = at_or_above(hist)
+    return area
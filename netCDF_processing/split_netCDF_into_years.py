@@ -1,38 +1,95 @@
-"""
-Script to split the output netCDF file into years/decades and/or regions.
-"""
-import xarray as xr
-
-models = ['access', 'mri']
-scenarios = ['ssp126', 'ssp245', 'ssp370']
-years = range(2025, 2101)
-
-for model in models:
-    for scenario in scenarios:
-        # Open the combined NetCDF file
-        ds = xr.open_dataset(f'/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_south/output_{model}_south_{scenario}_2025_2100_v2.nc') # <-- Edit as necessary
-
-        # Process only for North America/Eurasia (change as appropriate)
-        #ds_subset = ds.sel(lon=ds.lon[ds.lon >= 0])
-        
-        # Split by year
-        for year in years:
-            #yearly_ds = ds_subset.sel(time=str(year))
-            yearly_ds = ds.sel(time=str(year))
-            yearly_ds.to_netcdf(f"/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_south/{scenario}/output_{model}_south_{scenario}_{year}_v2.nc", encoding={"predictions": {"zlib": True, "complevel": 9}}) # <-- Edit as necessary
-
-            print(f"Saved for {model} {scenario} {year} Siberia")
-
-"""
-# For 2025-2030 - Split by **6-years**
-sixyr_ds = ds.sel(time=slice(str(2025), str(2030)))
-    sixyr_ds.to_netcdf("/gws/nopw/j04/bas_climate/users/clelland/model/output_access_combined/ssp126/output_access_combined_ssp126_2025_2030.nc", encoding={"predictions": {"zlib": True, "complevel": 9}})
-
-# Split by **decade**
-for start_year in range(2031, 2101, 10):  # Start from 2031, step by 10 years
-    end_year = start_year + 9
-    decadal_ds = ds_subset.sel(time=slice(str(start_year), str(end_year)))
-    decadal_ds.to_netcdf(f"/gws/nopw/j04/bas_climate/users/clelland/model/output_access_north/ssp126/output_access_north_ssp126_{start_year}_{end_year}_v2_eurasia.nc", encoding={"predictions": {"zlib": True, "complevel": 9}})
-    print(f'Saved netCDF for {start_year}_{end_year}')
-
-"""
\ No newline at end of file
+"""
+Script to split the output netCDF file into years/decades and/or regions.
+
+The yearly (or decadal) files are written in parallel worker processes, with a configurable codec and compression level and chunk shapes aligned to the per-year read pattern of the time-series scripts. Zarr stores can be written instead of netCDF files.
+"""
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from burned_area_engine import open_predictions
+
+models = ['access', 'mri']
+scenarios = ['ssp126', 'ssp245', 'ssp370']
+years = range(2025, 2101)
+
+# Input and output path templates - the output extension is added from output_format
+input_template = '/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_south/output_{model}_south_{scenario}_2025_2100_v2.nc' # <-- Edit as necessary
+output_template = '/gws/nopw/j04/bas_climate/users/clelland/model/output_{model}_south/{scenario}/output_{model}_south_{scenario}_{period}_v2' # <-- Edit as necessary
+
+# Split by 'year', or by 'decade' (2025-2030, then 2031-2040, ... 2091-2100)
+split_by = 'year' # <-- Edit as necessary
+
+# Process only for North America/Eurasia (change as appropriate): None keeps the whole file, 'eurasia' keeps lon >= 0, 'north_america' keeps lon < 0
+region = None # <-- Edit as necessary
+
+# Output format and compression: level 4-5 is nearly as small as 9 and much faster to write
+output_format = 'netcdf' # <-- 'netcdf' or 'zarr'
+codec = 'zlib' # <-- 'zlib', or e.g. 'zstd' (netCDF4 >= 1.6 with the HDF5 plugins, or Blosc for zarr)
+complevel = 4 # <-- Edit as necessary
+
+# One month per chunk, tiled in lat/lon, so the time-series scripts inflate each chunk once per read
+chunk_shape = {'time': 1, 'lat': 512, 'lon': 512} # <-- Edit as necessary
+
+# Lazy loading: None reads the combined file eagerly, 'disk' (or a dict of time/lat/lon sizes) streams it one dask chunk at a time with bounded memory
+chunks = 'disk' # <-- Edit as necessary
+
+# Number of worker processes writing files at the same time
+n_workers = int(os.environ.get("SLURM_CPUS_PER_TASK", 1)) # <-- Edit as necessary
+
+
+def split_periods():
+    """(label, start year, end year) for each output file."""
+    if split_by == 'decade':
+        periods = [('2025_2030', 2025, 2030)]
+        periods += [(f'{start}_{start + 9}', start, start + 9) for start in range(2031, 2101, 10)]
+        return periods
+    return [(str(year), year, year) for year in years]
+
+
+def encoding_for(ds):
+    """Per-variable encoding for the chosen format, codec, level and chunk shape."""
+    da = ds['predictions']
+    chunksizes = tuple(min(chunk_shape[dim], size) for dim, size in zip(da.dims, da.shape))
+    if output_format == 'zarr':
+        from zarr.codecs import BloscCodec, BloscShuffle, GzipCodec
+        # zarr 3 codecs: zlib is the deflate of GzipCodec, the other codecs go through Blosc
+        if codec == 'zlib':
+            compressor = GzipCodec(level=complevel)
+        else:
+            compressor = BloscCodec(cname=codec, clevel=complevel, shuffle=BloscShuffle.shuffle)
+        return {'predictions': {'compressors': (compressor,), 'chunks': chunksizes}}
+    if codec == 'zlib':
+        return {'predictions': {'zlib': True, 'complevel': complevel, 'shuffle': True, 'chunksizes': chunksizes}}
+    return {'predictions': {'compression': codec, 'complevel': complevel, 'shuffle': True, 'chunksizes': chunksizes}}
+
+
+def write_unit(unit):
+    """Open the combined file and write one period for one model/scenario."""
+    model, scenario, label, start, end = unit
+    ds = open_predictions(input_template.format(model=model, scenario=scenario), chunks)
+    if region == 'eurasia':
+        ds = ds.sel(lon=ds.lon[ds.lon >= 0])
+    elif region == 'north_america':
+        ds = ds.sel(lon=ds.lon[ds.lon < 0])
+    subset = ds.sel(time=slice(str(start), str(end)))
+
+    output_path = output_template.format(model=model, scenario=scenario, period=label)
+    encoding = encoding_for(subset)
+    if output_format == 'zarr':
+        output_path += '.zarr'
+        # Zarr chunks must line up with the dask chunks being written
+        subset = subset.chunk(dict(zip(subset['predictions'].dims, encoding['predictions']['chunks'])))
+        subset.to_zarr(output_path, mode='w', encoding=encoding, consolidated=True, zarr_format=3)
+    else:
+        output_path += '.nc'
+        subset.to_netcdf(output_path, encoding=encoding)
+    ds.close()
+    return output_path
+
+
+units = [(model, scenario, label, start, end) for model in models for scenario in scenarios for label, start, end in split_periods()]
+
+# Fork so the workers inherit this script's settings without re-running it
+with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context('fork')) as executor:
+    for (model, scenario, label, _, _), output_path in zip(units, executor.map(write_unit, units)):
+        print(f"Saved for {model} {scenario} {label}: {output_path}")
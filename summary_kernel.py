@@ -0,0 +1,259 @@
+"""
+Vectorised kernel for the ecoregion summary statistics: monthly bias correction of the CMIP6 models against the observations, period means and percentage changes for every region, variable and model at once.
+
+The time series are stacked into a (region, model, variable, time) cube on a shared monthly date axis, with the observations as model 0. The monthly climatological biases, corrected series and period means are then a few broadcast operations rather than a groupby and boolean masks per region and variable. `summary_table` gives the same rows, in the same order, as the `{region}_summary.csv` files.
+
+Each region's cube is cached as a .npz file. For incremental runs, the input files of each region are fingerprinted (size and modification time, or a content hash) and the fingerprints saved with the cache, so only the regions whose inputs changed are read again. A SummaryCache over the cached cubes memoises the bias corrections, corrected series, period means, monthly climatologies and annual means, so other periods, baselines and bias windows can be evaluated interactively without touching the raw files.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+def build_cube(region_frames, models, variables):
+    """
+    Stack the per-region series into a float64 (region, model, variable, time) cube.
+
+    region_frames is a dict of region -> {model: DataFrame indexed by date with the variable columns}, with the observations as the first model. Missing values are NaN. Returns (cube, dates), where dates is the union of all the dates.
+    """
+    dates = pd.DatetimeIndex([])
+    for frames in region_frames.values():
+        for df in frames.values():
+            dates = dates.union(pd.to_datetime(df.index))
+
+    cube = np.full((len(region_frames), len(models), len(variables), len(dates)), np.nan)
+    for i, frames in enumerate(region_frames.values()):
+        for j, model in enumerate(models):
+            df = frames[model].set_axis(pd.to_datetime(frames[model].index))
+            cube[i, j] = df.reindex(index=dates, columns=variables).to_numpy(dtype=float).T
+    return cube, dates
+
+
+def window(dates, start, end):
+    """Boolean mask of the dates from start to end inclusive."""
+    return np.asarray((dates >= start) & (dates <= end))
+
+
+def nanmean(values, axis=-1):
+    """Mean ignoring NaN along axis, NaN where there are no values (as pandas mean)."""
+    valid = ~np.isnan(values)
+    total = np.where(valid, values, 0.0).sum(axis=axis)
+    count = valid.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def group_mean(values, one_hot):
+    """Mean of values (time last) in each group of a (time, group) one-hot matrix, ignoring NaN - NaN for groups without data."""
+    valid = ~np.isnan(values)
+    totals = np.where(valid, values, 0.0) @ one_hot
+    counts = valid.astype(float) @ one_hot
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+
+def monthly_mean(values, dates):
+    """Mean of values (time last) for each calendar month, as a (..., 12) array."""
+    return group_mean(values, np.eye(12)[dates.month.values - 1])
+
+
+def monthly_bias(cube, dates, bias_window):
+    """
+    Mean (observed - model) difference for each calendar month over bias_window, as a (region, model, variable, 12) array.
+
+    The months are summed with one matrix product against a one-hot month matrix; months with no overlapping data are NaN.
+    """
+    in_window = window(dates, *bias_window)
+    return monthly_mean(cube[:, :1, :, in_window] - cube[:, :, :, in_window], dates[in_window])
+
+
+def correct(cube, dates, bias):
+    """Add each model's monthly bias to its series. The observations (model 0) are left as they are."""
+    corrected = cube.copy()
+    corrected[:, 1:] += bias[:, 1:, :, dates.month.values - 1]
+    return corrected
+
+
+def period_means(series, dates, periods):
+    """Dict of period label -> (region, model, variable) mean over the period."""
+    return {label: nanmean(series[..., window(dates, start, end)]) for label, (start, end) in periods.items()}
+
+
+def percent_changes(means, baseline):
+    """Dict of period label -> (region, model, variable) % change of each period mean from the observed baseline mean."""
+    baseline_mean = means[baseline][:, :1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {label: (mean - baseline_mean) / baseline_mean * 100 for label, mean in means.items() if label != baseline}
+
+
+def summarise(cube, dates, periods, baseline='historical', bias_window=('2015-01-01', '2023-12-31')):
+    """Bias-correct the models over bias_window and return (period means, % changes from the observed baseline period mean)."""
+    corrected = correct(cube, dates, monthly_bias(cube, dates, bias_window))
+    means = period_means(corrected, dates, periods)
+    return means, percent_changes(means, baseline)
+
+
+def summary_table(regions, models, variables, means, changes, baseline='historical'):
+    """
+    Tidy summary with columns region, variable, model, period, percent_change, mean_value.
+
+    For each region and variable the rows are every future period x model, then the observed baseline row with percent_change 0, as in the `{region}_summary.csv` files.
+    """
+    future = list(changes)
+    n_regions, n_vars = len(regions), len(variables)
+
+    # (region, variable, period, model) blocks, flattened so each region/variable is one run of rows
+    percent = np.stack([changes[label][:, 1:] for label in future], axis=1).transpose(0, 3, 1, 2).reshape(n_regions, n_vars, -1)
+    mean_value = np.stack([means[label][:, 1:] for label in future], axis=1).transpose(0, 3, 1, 2).reshape(n_regions, n_vars, -1)
+    percent = np.concatenate([percent, np.zeros((n_regions, n_vars, 1))], axis=2)
+    mean_value = np.concatenate([mean_value, means[baseline][:, 0, :, None]], axis=2)
+
+    row_models = [model for _ in future for model in models[1:]] + [models[0]]
+    row_periods = [label for label in future for _ in models[1:]] + [baseline]
+    n_rows = len(row_models)
+    return pd.DataFrame({
+        'region': np.repeat(np.asarray(regions, dtype=object), n_vars * n_rows),
+        'variable': np.tile(np.repeat(np.asarray(variables, dtype=object), n_rows), n_regions),
+        'model': np.tile(np.asarray(row_models, dtype=object), n_regions * n_vars),
+        'period': np.tile(np.asarray(row_periods, dtype=object), n_regions * n_vars),
+        'percent_change': percent.ravel(),
+        'mean_value': mean_value.ravel()
+    })
+
+
+def file_fingerprint(path, method='mtime'):
+    """Fingerprint of an input file: its size and modification time ('mtime'), or a SHA-1 of its contents ('hash'). None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    if method == 'hash':
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_fingerprints(state_path):
+    """Saved {'settings': ..., 'regions': {region: {path: fingerprint}}} of the last run, or empty if there was none."""
+    if not os.path.exists(state_path):
+        return {'settings': None, 'regions': {}}
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def save_fingerprints(state_path, settings, regions):
+    """Save the settings and region input fingerprints of this run."""
+    with open(state_path, 'w') as f:
+        json.dump({'settings': json.loads(json.dumps(settings)), 'regions': regions}, f, indent=1)
+
+
+def stale_regions(state, settings, fingerprints):
+    """Regions whose input fingerprints differ from the saved ones - all of them if the settings changed."""
+    if state['settings'] != json.loads(json.dumps(settings)):
+        return list(fingerprints)
+    return [region for region, files in fingerprints.items() if state['regions'].get(region) != files]
+
+
+def save_cube(path, cube, dates, models, variables):
+    """Cache one region's (model, variable, time) cube as a .npz file."""
+    np.savez(path, cube=cube, dates=dates.values.astype('datetime64[ns]'), models=np.asarray(models), variables=np.asarray(variables))
+
+
+def load_cubes(paths):
+    """
+    Stack cached region cubes into one (region, model, variable, time) cube on the union of their dates.
+
+    Returns (cube, dates, models, variables).
+    """
+    parts = []
+    for path in paths:
+        with np.load(path) as f:
+            parts.append((f['cube'], pd.DatetimeIndex(f['dates']), list(f['models']), list(f['variables'])))
+    models, variables = parts[0][2], parts[0][3]
+    dates = pd.DatetimeIndex([])
+    for path, (_, part_dates, part_models, part_variables) in zip(paths, parts):
+        if part_models != models or part_variables != variables:
+            raise ValueError(f"{path} has different models or variables to {paths[0]} - rebuild the cache")
+        dates = dates.union(part_dates)
+
+    cube = np.full((len(parts), len(models), len(variables), len(dates)), np.nan)
+    for i, (part, part_dates, _, _) in enumerate(parts):
+        cube[i][..., dates.get_indexer(part_dates)] = part
+    return cube, dates, models, variables
+
+
+class SummaryCache:
+    """
+    Memoised summary intermediates of a (region, model, variable, time) cube, for interactive reruns.
+
+    The monthly biases and corrected series are kept per bias window and the period means per bias window and period, so changing the periods or baseline only computes the means that are new.
+    """
+
+    def __init__(self, cube, dates, regions, models, variables):
+        self.cube = cube
+        self.dates = dates
+        self.regions = list(regions)
+        self.models = list(models)
+        self.variables = list(variables)
+        self._bias = {}
+        self._corrected = {}
+        self._means = {}
+        self._climatologies = {}
+        self._annual = {}
+
+    @classmethod
+    def load(cls, cache_dir, regions):
+        """SummaryCache over the cached cubes of regions in cache_dir."""
+        cube, dates, models, variables = load_cubes([f'{cache_dir}/{region}.npz' for region in regions])
+        return cls(cube, dates, regions, models, variables)
+
+    def monthly_bias(self, bias_window):
+        """(region, model, variable, 12) mean monthly (observed - model) difference over bias_window."""
+        key = tuple(bias_window)
+        if key not in self._bias:
+            self._bias[key] = monthly_bias(self.cube, self.dates, key)
+        return self._bias[key]
+
+    def corrected(self, bias_window):
+        """(region, model, variable, time) series with the models corrected over bias_window."""
+        key = tuple(bias_window)
+        if key not in self._corrected:
+            self._corrected[key] = correct(self.cube, self.dates, self.monthly_bias(key))
+        return self._corrected[key]
+
+    def period_mean(self, bias_window, start, end):
+        """(region, model, variable) mean of the corrected series from start to end."""
+        key = (tuple(bias_window), start, end)
+        if key not in self._means:
+            self._means[key] = nanmean(self.corrected(bias_window)[..., window(self.dates, start, end)])
+        return self._means[key]
+
+    def monthly_climatology(self, bias_window, start, end):
+        """(region, model, variable, 12) calendar month means of the corrected series from start to end."""
+        key = (tuple(bias_window), start, end)
+        if key not in self._climatologies:
+            in_window = window(self.dates, start, end)
+            self._climatologies[key] = monthly_mean(self.corrected(bias_window)[..., in_window], self.dates[in_window])
+        return self._climatologies[key]
+
+    def annual_means(self, bias_window):
+        """(years, (region, model, variable, year) annual means of the corrected series)."""
+        key = tuple(bias_window)
+        if key not in self._annual:
+            years, year_index = np.unique(self.dates.year.values, return_inverse=True)
+            self._annual[key] = (years, group_mean(self.corrected(key), np.eye(len(years))[year_index]))
+        return self._annual[key]
+
+    def summarise(self, periods, baseline='historical', bias_window=('2015-01-01', '2023-12-31')):
+        """(period means, % changes from the observed baseline period mean) for a dict of period label -> (start, end)."""
+        means = {label: self.period_mean(bias_window, start, end) for label, (start, end) in periods.items()}
+        return means, percent_changes(means, baseline)
+
+    def summary_table(self, periods, baseline='historical', bias_window=('2015-01-01', '2023-12-31')):
+        """Tidy summary of every region, as in master_summary.csv."""
+        means, changes = self.summarise(periods, baseline, bias_window)
+        return summary_table(self.regions, self.models, self.variables, means, changes, baseline)